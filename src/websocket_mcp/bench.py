@@ -0,0 +1,497 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import functools
+import json
+import random
+import subprocess
+import sys
+import time
+import websockets
+
+from .mcp_server import MCPServer, serve_connection, register_example_handlers, METHOD_NOT_FOUND
+from .local_llm_server import register_llm_handlers
+from .llm_backend import ModelInventory
+from .mcp_client import MCPClient, websocket_transport_client
+from .transport import select_subprotocol
+from .codec import get_codec, available_subprotocols, parse_subprotocols, CODEC_CHOICES
+from .compression import add_compression_arguments, compression_from_args
+from .scheduler import PRIORITY_NORMAL
+from . import eventloop
+
+# Request mix as method=weight pairs; see parse_mix().
+DEFAULT_MIX = "list_resources=4,echo=4,stream_data=1,ask_llm=1"
+BENCH_METHODS = ("list_resources", "echo", "stream_data", "ask_llm")
+
+# Cheap requests telling whether a server implements each method: any
+# answer but METHOD_NOT_FOUND counts. ask_llm without a prompt is rejected
+# before a generation starts.
+PROBE_PARAMS = {
+    "list_resources": {},
+    "echo": {"payload": ""},
+    "stream_data": {"stream_id": "bench-probe", "chunks": 1, "interval": 0},
+    "ask_llm": {},
+}
+
+DEFAULT_CONNECTIONS = 10
+DEFAULT_DURATION = 10.0
+DEFAULT_URI = "ws://127.0.0.1:8765"
+
+# The stub server (--stub) listens here and answers ask_llm with canned
+# tokens at a fixed pace, so the benchmark runs without ollama.
+DEFAULT_STUB_PORT = 8767
+DEFAULT_STUB_TOKENS = 32
+DEFAULT_STUB_TOKEN_DELAY = 0.002
+STUB_MODEL = "stub:latest"
+
+# Seconds to wait for a spawned stub server to accept connections.
+STUB_STARTUP_TIMEOUT = 10.0
+
+class StubBackend:
+    """
+    Stands in for OllamaBackend: every generation streams 'tokens' canned
+    tokens, one every 'token_delay' seconds.
+    """
+    def __init__(self, tokens=DEFAULT_STUB_TOKENS, token_delay=DEFAULT_STUB_TOKEN_DELAY):
+        self.tokens = tokens
+        self.token_delay = token_delay
+
+    async def generate(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        return "".join([chunk async for chunk in self.stream(model, prompt, options, priority, owner)])
+
+    async def stream(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        for i in range(self.tokens):
+            await asyncio.sleep(self.token_delay)
+            yield f"token{i} "
+
+    async def list_models(self):
+        return [STUB_MODEL]
+
+    async def model_digests(self):
+        return {STUB_MODEL: "stub"}
+
+async def stub_server_handler(websocket, backend, inventory):
+    server = MCPServer("bench-stub-server", "1.0.0", capabilities={"streaming": True, "llm": True},
+                       concurrent=True)
+    register_example_handlers(server)
+    register_llm_handlers(server, backend, inventory)
+    await serve_connection(server, websocket)
+
+async def serve_stub(port, tokens, token_delay):
+    """
+    Serve every benchmarked method, with ask_llm backed by a StubBackend,
+    until the process is terminated.
+    """
+    backend = StubBackend(tokens, token_delay)
+    inventory = ModelInventory(backend)
+    handler = functools.partial(stub_server_handler, backend=backend, inventory=inventory)
+    async with websockets.serve(handler, "127.0.0.1", port, subprotocols=available_subprotocols(),
+                                select_subprotocol=select_subprotocol):
+        await asyncio.Future()
+
+async def spawn_stub(port, tokens, token_delay, loop=eventloop.LOOP_ASYNCIO, eager_tasks=False):
+    """
+    Start the stub server in a child process, so its CPU time and memory
+    are measured apart from the load generator's, and wait until it listens.
+    The stub runs on the same kind of event loop as the load generator.
+    """
+    command = [sys.executable, "-m", "websocket_mcp.bench", "--serve-stub", "--stub-port", str(port),
+               "--stub-tokens", str(tokens), "--stub-token-delay", str(token_delay), "--loop", loop]
+    if eager_tasks:
+        command.append("--eager-tasks")
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + STUB_STARTUP_TIMEOUT
+    while True:
+        # Complete a WebSocket handshake, so the stub does not log a
+        # failed one for a bare TCP probe.
+        try:
+            async with websockets.connect(f"ws://127.0.0.1:{port}", subprotocols=available_subprotocols()):
+                return process
+        except (OSError, websockets.exceptions.InvalidHandshake):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Stub server did not start")
+            await asyncio.sleep(0.05)
+
+def parse_mix(value):
+    """
+    Parse a request mix such as "echo=3,ask_llm=1" into {method: weight}.
+    """
+    mix = {}
+    for item in value.split(","):
+        method, _, weight = item.strip().partition("=")
+        if method not in BENCH_METHODS:
+            raise ValueError(f"Unknown method '{method}'")
+        mix[method] = float(weight or 1)
+    return mix
+
+def rss_bytes(pid="self"):
+    """
+    Return the resident set size of process 'pid', or None where /proc is
+    not available.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def percentiles(values):
+    """
+    Summarize latencies in seconds as milliseconds (nearest-rank percentiles).
+    """
+    if not values:
+        return None
+    values = sorted(values)
+
+    def rank(q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    return {
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "mean": sum(values) / len(values) * 1000,
+        "max": values[-1] * 1000,
+    }
+
+class Recorder:
+    """
+    Latencies, time-to-first-chunk samples and error counts per method.
+    """
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.first_chunks = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def report(self, elapsed):
+        methods = {}
+        for method in sorted(set(self.latencies) | set(self.errors)):
+            summary = {
+                "count": len(self.latencies[method]),
+                "errors": self.errors[method],
+                "latency_ms": percentiles(self.latencies[method]),
+            }
+            if self.first_chunks[method]:
+                summary["first_chunk_ms"] = percentiles(self.first_chunks[method])
+            methods[method] = summary
+        completed = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            "duration_s": elapsed,
+            "requests": completed,
+            "errors": sum(self.errors.values()),
+            "throughput_rps": completed / elapsed if elapsed else 0.0,
+            "methods": methods,
+        }
+
+class BenchConnection:
+    """
+    One initialized MCPClient connection driving requests from the mix.
+    """
+    def __init__(self, index, client, recorder, payload, model):
+        self.index = index
+        self.client = client
+        self.recorder = recorder
+        self.payload = payload
+        self.model = model
+        self.sent = 0
+        self.stream_starts = {}  # stream_data stream_id -> time of first chunk
+        client.register_notification_handler("stream_data_chunk", self.on_stream_chunk)
+        client.register_notification_handler("stream_complete", self.on_stream_complete)
+
+    async def on_stream_chunk(self, params):
+        self.stream_starts.setdefault(params.get("stream_id"), time.perf_counter())
+
+    async def on_stream_complete(self, params):
+        pass
+
+    async def call(self, method):
+        self.sent += 1
+        first_chunk = None
+        started = time.perf_counter()
+        if method == "echo":
+            await self.client.request("echo", {"payload": self.payload})
+        elif method == "list_resources":
+            await self.client.request("list_resources", {})
+        elif method == "stream_data":
+            stream_id = f"bench-{self.index}-{self.sent}"
+            await self.client.request("stream_data", {"stream_id": stream_id, "chunks": 5, "interval": 0})
+            first_chunk = self.stream_starts.pop(stream_id, None)
+        else:
+            params = {"prompt": f"Benchmark prompt {self.sent}"}
+            if self.model:
+                params["model"] = self.model
+            async for _ in self.client.stream("ask_llm", params):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+        finished = time.perf_counter()
+        self.recorder.latencies[method].append(finished - started)
+        if first_chunk is not None:
+            self.recorder.first_chunks[method].append(first_chunk - started)
+
+    async def drive(self, mix, deadline, rng):
+        methods, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline:
+            method = rng.choices(methods, weights)[0]
+            try:
+                await self.call(method)
+            except Exception:
+                self.recorder.errors[method] += 1
+
+class Run:
+    """
+    Coordinates the connections of one run: each one opens and initializes
+    its connection, then all start driving load together once every
+    connection is open (so memory can be measured in between).
+    """
+    def __init__(self, connections):
+        self.connections = connections
+        self.opened = 0
+        self.all_open = asyncio.Event()
+        self.start = asyncio.Event()
+        self.deadline = None
+
+    def connection_opened(self):
+        self.opened += 1
+        if self.opened == self.connections:
+            self.all_open.set()
+
+@contextlib.asynccontextmanager
+async def open_client(uri, options):
+    """
+    Open a connection and yield an initialized MCPClient on it. The
+    transport's task group must be entered and exited in the same task,
+    so the whole block has to run in one task.
+    """
+    async with websockets.connect(uri, subprotocols=options.subprotocols or available_subprotocols(),
+                                  max_size=None, **options.compression) as websocket:
+        async with websocket_transport_client(websocket, codec=options.codec) as (send_func, message_queue):
+            client = MCPClient("mcp-bench", "1.0.0", timeout=options.timeout)
+            client.send = send_func
+
+            async def process_messages():
+                while True:
+                    await client.receive(await message_queue.get())
+            reader = asyncio.create_task(process_messages())
+            try:
+                await client.connect(send_func)
+                yield client
+            finally:
+                reader.cancel()
+
+async def run_connection(index, uri, options, recorder, run, rng):
+    # Each connection lives entirely in its own task (see open_client()).
+    async with open_client(uri, options) as client:
+        connection = BenchConnection(index, client, recorder, options.payload, options.model)
+        run.connection_opened()
+        await run.start.wait()
+        await asyncio.gather(*(connection.drive(options.mix, run.deadline, rng)
+                               for _ in range(options.concurrency)))
+
+async def supported_methods(uri, options, methods):
+    """
+    Return those of 'methods' the server at 'uri' implements, by sending
+    each one its PROBE_PARAMS request.
+    """
+    async def ignore(params):
+        pass
+
+    supported = []
+    async with open_client(uri, options) as client:
+        # Keep the probe's stream_data notifications off the output.
+        client.register_notification_handler("stream_data_chunk", ignore)
+        client.register_notification_handler("stream_complete", ignore)
+        for method in methods:
+            try:
+                await client.request(method, PROBE_PARAMS[method])
+            except Exception as e:
+                error = e.args[0] if e.args else None
+                if not isinstance(error, dict):
+                    raise  # Not a JSON-RPC error response
+                if error.get("code") == METHOD_NOT_FOUND:
+                    continue
+            supported.append(method)
+    return supported
+
+async def run_bench(uri, options, server_pid=None):
+    """
+    Open 'options.connections' connections, drive the request mix over
+    each with 'options.concurrency' requests in flight for
+    'options.duration' seconds and return the report as a dict.
+    """
+    # Drop methods the server lacks, e.g. ask_llm on mcp-server or echo on
+    # local-llm-server, so they do not show up as errors.
+    supported = await supported_methods(uri, options, list(options.mix))
+    skipped = [method for method in options.mix if method not in supported]
+    if not supported:
+        raise RuntimeError(f"The server at {uri} implements none of {', '.join(options.mix)}")
+    if skipped:
+        print(f"Skipping methods the server does not implement: {', '.join(skipped)}", file=sys.stderr)
+        options.mix = {method: weight for method, weight in options.mix.items() if method in supported}
+    recorder = Recorder()
+    rng = random.Random(options.seed)
+    run = Run(options.connections)
+    client_before, server_before = rss_bytes(), rss_bytes(server_pid) if server_pid else None
+    tasks = [asyncio.create_task(run_connection(i, uri, options, recorder, run, rng))
+             for i in range(options.connections)]
+    opened = asyncio.create_task(run.all_open.wait())
+    try:
+        await asyncio.wait([opened, *tasks], return_when=asyncio.FIRST_COMPLETED)
+        if not opened.done():
+            # A connection failed before all were open.
+            for task in tasks:
+                if task.done():
+                    task.result()
+        client_after, server_after = rss_bytes(), rss_bytes(server_pid) if server_pid else None
+
+        started = time.perf_counter()
+        run.deadline = started + options.duration
+        run.start.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    finally:
+        opened.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    report = recorder.report(elapsed)
+    report["memory"] = {
+        "client_bytes_per_connection": per_connection(client_before, client_after, options.connections),
+        "server_bytes_per_connection": per_connection(server_before, server_after, options.connections),
+    }
+    report["config"] = {
+        "uri": uri,
+        "connections": options.connections,
+        "concurrency": options.concurrency,
+        "duration_s": options.duration,
+        "mix": options.mix,
+        "skipped_methods": skipped,
+        "payload_bytes": len(options.payload),
+        "codec": options.codec.name,
+        "loop": type(asyncio.get_running_loop()).__module__,
+        "eager_tasks": asyncio.get_running_loop().get_task_factory() is asyncio.eager_task_factory,
+    }
+    return report
+
+def per_connection(before, after, connections):
+    if before is None or after is None:
+        return None
+    return max(0, after - before) // connections
+
+def format_report(report):
+    lines = [
+        f"{report['requests']} requests in {report['duration_s']:.2f}s "
+        f"({report['throughput_rps']:.1f} req/s), {report['errors']} errors",
+    ]
+    for method, summary in report["methods"].items():
+        latency = summary["latency_ms"]
+        line = f"  {method:<15} {summary['count']:>7} ok {summary['errors']:>5} err"
+        if latency:
+            line += f"  p50 {latency['p50']:.2f}ms  p95 {latency['p95']:.2f}ms  p99 {latency['p99']:.2f}ms"
+        if "first_chunk_ms" in summary:
+            line += f"  first chunk p50 {summary['first_chunk_ms']['p50']:.2f}ms"
+        lines.append(line)
+    memory = report["memory"]
+    for side in ("client", "server"):
+        value = memory[f"{side}_bytes_per_connection"]
+        if value is not None:
+            lines.append(f"  {side} memory per connection: {value / 1024:.1f} KiB")
+    return "\n".join(lines)
+
+async def start_bench(options):
+    stub = None
+    uri = options.uri
+    if options.stub:
+        stub = await spawn_stub(options.stub_port, options.stub_tokens, options.stub_token_delay,
+                                options.loop, options.eager_tasks)
+        uri = f"ws://127.0.0.1:{options.stub_port}"
+    try:
+        return await run_bench(uri, options, stub.pid if stub else options.server_pid)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+def compare_loops(options):
+    """
+    Run the benchmark once for each of eventloop.loop_variants() and return
+    the reports by variant name, e.g. "uvloop+eager". With --stub, the stub
+    server runs on the same kind of loop, so the server side is compared too.
+    """
+    reports = {}
+    for loop, eager_tasks in eventloop.loop_variants():
+        options.loop, options.eager_tasks = loop, eager_tasks
+        name = f"{loop}+eager" if eager_tasks else loop
+        reports[name] = eventloop.run(start_bench(options), eventloop.loop_factory(loop, eager_tasks))
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark an MCP-over-WebSocket server.")
+    parser.add_argument('--uri', default=DEFAULT_URI,
+                        help='Server to benchmark, e.g. ws://127.0.0.1:8766 for the local LLM server')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help='Number of concurrent client connections')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Requests kept in flight on each connection')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help='Seconds to drive load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'Weighted request mix (default: {DEFAULT_MIX})')
+    parser.add_argument('--payload-size', type=int, default=64,
+                        help='Bytes of payload sent with each echo request')
+    parser.add_argument('--model', default=None, help='Model for ask_llm requests (default: server default)')
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help='Seconds to wait for each response or streamed ask_llm chunk')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the request mix')
+    parser.add_argument('--server-pid', type=int, default=None,
+                        help='PID of the benchmarked server, to report its memory per connection')
+    parser.add_argument('--json', default=None, metavar='PATH',
+                        help='Write the report as JSON to PATH ("-" for stdout)')
+    parser.add_argument('--codec', choices=CODEC_CHOICES, default='auto',
+                        help='JSON library used to encode and decode messages')
+    parser.add_argument('--subprotocols', type=parse_subprotocols, default=None,
+                        help='Comma-separated subprotocols to offer, most preferred first '
+                             '(default: all installed, binary first)')
+    add_compression_arguments(parser)
+    parser.add_argument('--stub', action='store_true',
+                        help='Benchmark a stub server with a canned LLM backend, started for the run')
+    parser.add_argument('--stub-port', type=int, default=DEFAULT_STUB_PORT)
+    parser.add_argument('--stub-tokens', type=int, default=DEFAULT_STUB_TOKENS,
+                        help='Tokens in each stub ask_llm answer')
+    parser.add_argument('--stub-token-delay', type=float, default=DEFAULT_STUB_TOKEN_DELAY,
+                        help='Seconds between stub ask_llm tokens')
+    eventloop.add_loop_arguments(parser)
+    parser.add_argument('--compare-loops', action='store_true',
+                        help='Run the benchmark once per available event loop, with and without eager tasks')
+    parser.add_argument('--serve-stub', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_stub:
+        eventloop.run(serve_stub(args.stub_port, args.stub_tokens, args.stub_token_delay),
+                      eventloop.loop_from_args(args))
+        return
+
+    args.codec = get_codec(args.codec)
+    args.compression = compression_from_args(args, server=False)
+    args.payload = "x" * args.payload_size
+    if args.compare_loops:
+        report = compare_loops(args)
+        text = "\n\n".join(f"{name}:\n{format_report(variant)}" for name, variant in report.items())
+    else:
+        report = eventloop.run(start_bench(args), eventloop.loop_from_args(args))
+        text = format_report(report)
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        print(text)
+        if args.json:
+            with open(args.json, "w") as output:
+                json.dump(report, output, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import asyncio
+import random
+import websockets
+
+from .codec import available_subprotocols
+from .mcp_client import MCPClient, websocket_transport_client
+from .transport import CONNECTION_CLOSED
+
+# Number of warm connections kept by default.
+DEFAULT_POOL_SIZE = 4
+
+# Reconnect backoff: the n-th consecutive failed attempt waits a random
+# time between 0 and min(DEFAULT_MAX_RECONNECT_DELAY, DEFAULT_RECONNECT_DELAY * 2**n)
+# seconds ("full jitter"), so clients cut off together do not reconnect in lockstep.
+DEFAULT_RECONNECT_DELAY = 1.0
+DEFAULT_MAX_RECONNECT_DELAY = 30.0
+
+# Requests that are safe to send twice and are therefore resent when the
+# connection carrying them drops.
+DEFAULT_IDEMPOTENT_METHODS = frozenset({"list_resources"})
+DEFAULT_MAX_RETRIES = 3
+
+# Errors meaning the connection went away underneath a request.
+CONNECTION_ERRORS = (ConnectionError, websockets.ConnectionClosed)
+
+class PooledConnection:
+    """
+    One pooled WebSocket connection, run by its own task.
+
+    The task opens the connection, performs the initialize handshake and
+    then processes incoming messages until the connection drops, after
+    which it reconnects with jittered exponential backoff. 'client' is the
+    initialized MCPClient while the connection is usable and None otherwise.
+    The server-issued session id is kept across reconnects so the server
+    can resume the session.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.client = None
+        self.inflight = 0
+        self.session_id = None
+        self.failures = 0  # Consecutive failed attempts, for the backoff
+        self.opened = asyncio.get_running_loop().create_future()  # Outcome of the first attempt
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        pool = self.pool
+        while True:
+            try:
+                async with websockets.connect(pool.uri, subprotocols=pool.subprotocols,
+                                              **pool.compression) as websocket:
+                    async with websocket_transport_client(websocket, codec=pool.codec) as (send_func, message_queue):
+                        await self.serve(send_func, message_queue)
+            except Exception as e:
+                if not self.opened.done():
+                    self.opened.set_exception(e)
+                    return
+                print(f"Pooled connection to {pool.uri} failed: {e}")
+            await asyncio.sleep(self.backoff())
+            self.failures += 1
+
+    def backoff(self):
+        pool = self.pool
+        return random.uniform(0, min(pool.max_reconnect_delay, pool.reconnect_delay * 2 ** self.failures))
+
+    async def serve(self, send_func, message_queue):
+        client = MCPClient(self.pool.name, self.pool.version, self.pool.capabilities, timeout=self.pool.timeout,
+                           traced=self.pool.traced)
+        client.send = send_func
+        client.session_id = self.session_id
+
+        async def process_messages():
+            while True:
+                message = await message_queue.get()
+                await client.receive(message)
+                if message is CONNECTION_CLOSED:
+                    return
+        reader = asyncio.create_task(process_messages())
+        try:
+            await client.connect(send_func)
+            self.session_id = client.session_id
+            self.failures = 0
+            self.client = client
+            self.pool.connection_ready(self)
+            if not self.opened.done():
+                self.opened.set_result(None)
+            await reader
+        finally:
+            self.client = None
+            self.pool.connection_lost(self)
+            reader.cancel()
+            # Callers waiting on this connection fail now (idempotent ones
+            # are retried) instead of waiting for their own timeout.
+            client.connection_lost()
+
+class MCPClientPool:
+    """
+    Keeps 'size' warm, already-initialized connections to one MCP server.
+
+    request() goes to the usable connection with the fewest requests in
+    flight, so concurrent callers share connections instead of each paying
+    for a WebSocket (and TLS) handshake plus the initialize exchange.
+    Lost connections are reopened and re-initialized in the background.
+    Requests that were in flight on them are resent on another connection
+    if their method is in 'idempotent_methods' (or the caller passes
+    idempotent=True), up to 'max_retries' times; otherwise they fail with
+    ConnectionError.
+
+    Usage:
+      async with MCPClientPool("ws://127.0.0.1:8766", size=8) as pool:
+          result = await pool.request("list_resources", {})
+    """
+    def __init__(self, uri, size=DEFAULT_POOL_SIZE, name="pool-client", version="1.0.0", capabilities=None,
+                 timeout=None, codec=None, subprotocols=None, compression=None,
+                 reconnect_delay=DEFAULT_RECONNECT_DELAY, max_reconnect_delay=DEFAULT_MAX_RECONNECT_DELAY,
+                 idempotent_methods=DEFAULT_IDEMPOTENT_METHODS, max_retries=DEFAULT_MAX_RETRIES, traced=False):
+        self.uri = uri
+        self.size = size
+        self.name = name
+        self.version = version
+        self.capabilities = capabilities or {}
+        self.timeout = timeout
+        self.codec = codec
+        self.subprotocols = subprotocols or available_subprotocols()
+        self.compression = compression or {}
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.idempotent_methods = idempotent_methods
+        self.max_retries = max_retries
+        self.traced = traced  # Propagate trace context (see MCPClient)
+        self.connections = []
+        self.ready = set()
+        self.any_ready = asyncio.Event()
+        self.closed = False
+
+    async def start(self):
+        """
+        Open all connections and wait until each has completed its first
+        handshake. Raises the first connection error, after closing the pool.
+        """
+        self.connections = [PooledConnection(self) for _ in range(self.size)]
+        try:
+            await asyncio.gather(*(connection.opened for connection in self.connections))
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self):
+        """
+        Close every connection. Requests in flight fail with ConnectionError,
+        and so do requests made afterwards.
+        """
+        self.closed = True
+        tasks = [connection.task for connection in self.connections]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.connections = []
+        self.any_ready.set()  # Wake callers waiting in acquire()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def connection_ready(self, connection):
+        self.ready.add(connection)
+        self.any_ready.set()
+
+    def connection_lost(self, connection):
+        self.ready.discard(connection)
+        if not self.ready:
+            self.any_ready.clear()
+
+    def client_failed(self, connection, client):
+        """
+        Stop routing requests to a connection whose client just failed, so
+        a retry waits for a reconnect instead of hitting the same socket.
+        """
+        if connection.client is client:
+            self.connection_lost(connection)
+
+    async def acquire(self):
+        """
+        Return the usable connection with the fewest requests in flight,
+        waiting for one to (re)connect if necessary. Raises ConnectionError
+        once the pool is closed.
+        """
+        while not self.ready:
+            if self.closed:
+                raise ConnectionError("Connection pool is closed")
+            await self.any_ready.wait()
+        return min(self.ready, key=lambda connection: connection.inflight)
+
+    async def request(self, method, params, timeout=None, idempotent=None):
+        if idempotent is None:
+            idempotent = method in self.idempotent_methods
+        retries = self.max_retries if idempotent else 0
+        for attempt in range(retries + 1):
+            connection = await self.acquire()
+            connection.inflight += 1
+            client = connection.client
+            try:
+                return await client.request(method, params, timeout)
+            except CONNECTION_ERRORS:
+                self.client_failed(connection, client)
+                if attempt == retries:
+                    raise
+            finally:
+                connection.inflight -= 1
+
+    async def request_batch(self, calls, return_exceptions=False, timeout=None, idempotent=None):
+        if idempotent is None:
+            idempotent = all(method in self.idempotent_methods for method, _ in calls)
+        retries = self.max_retries if idempotent else 0
+        for attempt in range(retries + 1):
+            connection = await self.acquire()
+            connection.inflight += len(calls)
+            client = connection.client
+            try:
+                return await client.request_batch(calls, return_exceptions, timeout)
+            except CONNECTION_ERRORS:
+                self.client_failed(connection, client)
+                if attempt == retries:
+                    raise
+            finally:
+                connection.inflight -= len(calls)
+
+    async def notify(self, method, params):
+        connection = await self.acquire()
+        await connection.client.notify(method, params)
+
+class ResilientMCPClient(MCPClientPool):
+    """
+    A single MCP connection that survives disconnects: it reconnects with
+    backoff, resumes its server session and resends idempotent requests.
+
+    Usage:
+      async with ResilientMCPClient("ws://127.0.0.1:8766") as client:
+          result = await client.request("list_resources", {})
+    """
+    def __init__(self, uri, **kwargs):
+        super().__init__(uri, size=1, **kwargs)
@@ -0,0 +1,125 @@
+import asyncio
+import contextlib
+import json
+
+from .scheduler import PRIORITY_NORMAL
+
+class SharedGeneration:
+    """
+    One backend generation followed by any number of requests.
+
+    The generation runs in its own task, so a follower that is cancelled
+    does not stop it for the others; it is only cancelled once every
+    follower has gone. Produced chunks are kept, so a follower that joins
+    late first gets the chunks it missed and then the live tail.
+    """
+    def __init__(self, coalescer, key):
+        self.coalescer = coalescer
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def start(self, stream):
+        # Called once the generation is registered: with an eager task
+        # factory, run() may finish and forget it before create_task returns.
+        self.task = asyncio.create_task(self.run(stream))
+
+    async def run(self, stream):
+        try:
+            async with contextlib.aclosing(stream):
+                async for chunk in stream:
+                    self.chunks.append(chunk)
+                    self.notify()
+        except BaseException as e:
+            self.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self.done = True
+            self.coalescer.forget(self)
+            self.notify()
+
+    def notify(self):
+        # Wake every waiting follower; later waiters use the fresh event.
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def follow(self):
+        """
+        Yield every chunk of the generation from the start, raising the
+        generation's error, if any, at the end.
+        """
+        self.followers += 1
+        try:
+            sent = 0
+            while True:
+                while sent < len(self.chunks):
+                    yield self.chunks[sent]
+                    sent += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self.changed.wait()
+        finally:
+            self.followers -= 1
+            if self.followers == 0 and not self.done:
+                self.coalescer.forget(self)
+                self.task.cancel()
+
+class CoalescingBackend:
+    """
+    Single-flight wrapper around an LLM backend.
+
+    Concurrent generate() and stream() calls with the same model, prompt
+    and options share one generation instead of each starting their own.
+    Only generations still in flight are shared; a call arriving after one
+    finished starts a new one (see response_cache for reusing answers).
+    A shared generation is scheduled with the priority and owner of the
+    call that started it.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.inflight = {}  # (model, prompt, options) -> SharedGeneration
+        self.started = 0
+        self.joined = 0
+
+    def join(self, model, prompt, options, priority, owner):
+        key = (model, prompt, json.dumps(options, sort_keys=True))
+        generation = self.inflight.get(key)
+        if generation is None:
+            stream = self.backend.stream(model, prompt, options, priority, owner)
+            generation = SharedGeneration(self, key)
+            self.inflight[key] = generation
+            generation.start(stream)
+            self.started += 1
+        else:
+            self.joined += 1
+        return generation
+
+    def forget(self, generation):
+        if self.inflight.get(generation.key) is generation:
+            del self.inflight[generation.key]
+
+    async def generate(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        async with contextlib.aclosing(self.stream(model, prompt, options, priority, owner)) as stream:
+            return "".join([chunk async for chunk in stream])
+
+    async def stream(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        generation = self.join(model, prompt, options, priority, owner)
+        async with contextlib.aclosing(generation.follow()) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    async def list_models(self):
+        return await self.backend.list_models()
+
+    async def model_digests(self):
+        return await self.backend.model_digests()
+
+    def metrics(self):
+        return {"inflight": len(self.inflight), "started": self.started, "joined": self.joined}
@@ -0,0 +1,195 @@
+import json
+
+# Optional fast JSON libraries; the stdlib codec is used when neither is installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Optional binary codecs, negotiated as WebSocket subprotocols.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# WebSocket subprotocol names. Without a negotiated binary subprotocol,
+# messages are JSON text frames.
+JSON_SUBPROTOCOL = "mcp.json"
+MSGPACK_SUBPROTOCOL = "mcp.msgpack"
+CBOR_SUBPROTOCOL = "mcp.cbor"
+
+class EncodeError(ValueError):
+    """
+    Raised by every codec's encode() for a message holding values it
+    cannot represent.
+    """
+
+class StdlibJSONCodec:
+    """
+    JSON codec built on the standard library.
+
+    encode() returns str; decode() accepts str or bytes. Decoding errors are
+    raised as ValueError and encoding errors as EncodeError, as with every
+    codec. 'text' tells the transport to send text rather than binary frames.
+    """
+    name = "json"
+    text = True
+
+    def encode(self, message):
+        try:
+            return json.dumps(message)
+        except (TypeError, ValueError, RecursionError) as e:
+            raise EncodeError(f"Cannot encode message as JSON: {e}") from e
+
+    def decode(self, data):
+        return json.loads(data)
+
+class OrjsonCodec:
+    """
+    JSON codec built on orjson. encode() returns UTF-8 bytes.
+    """
+    name = "orjson"
+    text = True
+
+    def encode(self, message):
+        try:
+            return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError as e:
+            raise EncodeError(f"Cannot encode message as JSON: {e}") from e
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+class MsgspecJSONCodec:
+    """
+    JSON codec built on msgspec. encode() returns UTF-8 bytes.
+    """
+    name = "msgspec"
+    text = True
+
+    def __init__(self):
+        self.encoder = msgspec.json.Encoder()
+        self.decoder = msgspec.json.Decoder()
+
+    def encode(self, message):
+        try:
+            return self.encoder.encode(message)
+        except (TypeError, msgspec.EncodeError) as e:
+            raise EncodeError(f"Cannot encode message as JSON: {e}") from e
+
+    def decode(self, data):
+        return self.decoder.decode(data)
+
+class MsgpackCodec:
+    """
+    MessagePack codec; bytes values travel as raw binary.
+    """
+    name = "msgpack"
+    text = False
+
+    def encode(self, message):
+        try:
+            return msgpack.packb(message)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise EncodeError(f"Cannot encode message as MessagePack: {e}") from e
+
+    def decode(self, data):
+        try:
+            # JSON-RPC params may hold maps with integer keys.
+            return msgpack.unpackb(data, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"Invalid MessagePack frame: {e}") from e
+
+class CborCodec:
+    """
+    CBOR codec; bytes values travel as raw binary.
+    """
+    name = "cbor"
+    text = False
+
+    def encode(self, message):
+        try:
+            return cbor2.dumps(message)
+        except (TypeError, ValueError, cbor2.CBOREncodeError) as e:
+            raise EncodeError(f"Cannot encode message as CBOR: {e}") from e
+
+    def decode(self, data):
+        try:
+            return cbor2.loads(data)
+        except Exception as e:
+            raise ValueError(f"Invalid CBOR frame: {e}") from e
+
+# Codec name -> (factory, whether its library is importable), fastest first.
+JSON_CODECS = {
+    "orjson": (OrjsonCodec, orjson is not None),
+    "msgspec": (MsgspecJSONCodec, msgspec is not None),
+    "json": (StdlibJSONCodec, True),
+}
+
+# Accepted by get_codec() and the --codec command line options.
+CODEC_CHOICES = ("auto", *JSON_CODECS)
+
+def get_codec(name="auto"):
+    """
+    Return a JSON codec instance.
+
+    "auto" (or None) picks the fastest installed library; an explicit name
+    raises ValueError if that library is not available.
+    """
+    if name in (None, "auto"):
+        for factory, available in JSON_CODECS.values():
+            if available:
+                return factory()
+    if name not in JSON_CODECS:
+        raise ValueError(f"Unknown codec '{name}'")
+    factory, available = JSON_CODECS[name]
+    if not available:
+        raise ValueError(f"Codec '{name}' requires the {name} package")
+    return factory()
+
+# Binary subprotocol -> (factory, whether its library is importable).
+BINARY_CODECS = {
+    MSGPACK_SUBPROTOCOL: (MsgpackCodec, msgpack is not None),
+    CBOR_SUBPROTOCOL: (CborCodec, cbor2 is not None),
+}
+
+SUBPROTOCOL_CHOICES = (*BINARY_CODECS, JSON_SUBPROTOCOL)
+
+def available_subprotocols():
+    """
+    Return the subprotocols this installation can speak, binary ones first.
+    """
+    return [subprotocol for subprotocol, (_, available) in BINARY_CODECS.items() if available] + [JSON_SUBPROTOCOL]
+
+def parse_subprotocols(value):
+    """
+    Parse a comma-separated subprotocol preference list, e.g. from the
+    --subprotocols command line option.
+    """
+    subprotocols = [name.strip() for name in value.split(",") if name.strip()]
+    for subprotocol in subprotocols:
+        if subprotocol not in SUBPROTOCOL_CHOICES:
+            raise ValueError(f"Unknown subprotocol '{subprotocol}'")
+        if subprotocol not in available_subprotocols():
+            raise ValueError(f"Subprotocol '{subprotocol}' requires a package that is not installed")
+    return subprotocols
+
+def codec_for_subprotocol(subprotocol, json_codec=None):
+    """
+    Return the codec for a negotiated subprotocol. JSON (or no subprotocol
+    at all) uses 'json_codec', defaulting to get_codec().
+    """
+    if subprotocol in BINARY_CODECS:
+        factory, _ = BINARY_CODECS[subprotocol]
+        return factory()
+    return json_codec or get_codec()
@@ -0,0 +1,123 @@
+from websockets.extensions.base import Extension
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory, ServerPerMessageDeflateFactory
+from websockets.frames import Opcode
+
+# permessage-deflate defaults, matching the ones websockets uses on its own.
+DEFAULT_WINDOW_BITS = 12
+DEFAULT_MEM_LEVEL = 5
+
+# Messages smaller than this many bytes are sent uncompressed. 0 compresses
+# every message, as websockets does by default.
+DEFAULT_MIN_SIZE = 0
+
+class SizeThresholdDeflate(Extension):
+    """
+    permessage-deflate extension that skips compression for small messages.
+
+    RFC 7692 marks each compressed message with the RSV1 bit, so a sender
+    may leave any message uncompressed and the peer needs no special
+    support. Only complete, unfragmented messages are skipped.
+    """
+    def __init__(self, extension, min_size):
+        self.extension = extension
+        self.name = extension.name
+        self.min_size = min_size
+
+    def decode(self, frame, *, max_size=None):
+        return self.extension.decode(frame, max_size=max_size)
+
+    def encode(self, frame):
+        if frame.opcode is not Opcode.CONT and frame.fin and len(frame.data) < self.min_size:
+            return frame
+        return self.extension.encode(frame)
+
+    def __repr__(self):
+        return f"SizeThresholdDeflate({self.extension!r}, min_size={self.min_size})"
+
+class ServerDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, SizeThresholdDeflate(extension, self.min_size)
+
+class ClientDeflateFactory(ClientPerMessageDeflateFactory):
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        return SizeThresholdDeflate(extension, self.min_size)
+
+def compress_settings(mem_level, level):
+    settings = {"memLevel": mem_level}
+    if level is not None:
+        settings["level"] = level
+    return settings
+
+def server_compression(enabled=True, window_bits=DEFAULT_WINDOW_BITS, mem_level=DEFAULT_MEM_LEVEL,
+                       level=None, min_size=DEFAULT_MIN_SIZE):
+    """
+    Return websockets.serve() keyword arguments configuring permessage-deflate.
+
+    'window_bits' bounds the LZ77 window in both directions, 'mem_level' and
+    'level' are passed to zlib, and messages under 'min_size' bytes are
+    sent uncompressed.
+    """
+    if not enabled:
+        return {"compression": None}
+    factory = ServerDeflateFactory(
+        min_size=min_size,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings=compress_settings(mem_level, level),
+    )
+    return {"extensions": [factory]}
+
+def client_compression(enabled=True, window_bits=DEFAULT_WINDOW_BITS, mem_level=DEFAULT_MEM_LEVEL,
+                       level=None, min_size=DEFAULT_MIN_SIZE):
+    """
+    Return websockets.connect() keyword arguments configuring permessage-deflate.
+    See server_compression() for the options.
+    """
+    if not enabled:
+        return {"compression": None}
+    factory = ClientDeflateFactory(
+        min_size=min_size,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings=compress_settings(mem_level, level),
+    )
+    return {"extensions": [factory]}
+
+def add_compression_arguments(parser):
+    """
+    Add the permessage-deflate command line options to an argparse parser.
+    """
+    parser.add_argument('--no-compression', action='store_true',
+                        help='Disable permessage-deflate compression')
+    parser.add_argument('--compression-window-bits', type=int, default=DEFAULT_WINDOW_BITS,
+                        help='permessage-deflate window size, 9 to 15 bits')
+    parser.add_argument('--compression-mem-level', type=int, default=DEFAULT_MEM_LEVEL,
+                        help='zlib memory level used for compression, 1 to 9')
+    parser.add_argument('--compression-level', type=int, default=None,
+                        help='zlib compression level, 0 to 9 (default: zlib default)')
+    parser.add_argument('--compression-min-size', type=int, default=DEFAULT_MIN_SIZE,
+                        help='Send messages smaller than this many bytes uncompressed')
+
+def compression_from_args(args, server):
+    """
+    Build serve() (server=True) or connect() keyword arguments from the
+    options added by add_compression_arguments().
+    """
+    options = server_compression if server else client_compression
+    return options(
+        enabled=not args.no_compression,
+        window_bits=args.compression_window_bits,
+        mem_level=args.compression_mem_level,
+        level=args.compression_level,
+        min_size=args.compression_min_size,
+    )
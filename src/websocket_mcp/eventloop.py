@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import os
+
+# Optional faster event loop.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Values of --loop: the standard asyncio loop, uvloop (which must be
+# installed), or uvloop when it is installed and asyncio otherwise.
+LOOP_ASYNCIO = "asyncio"
+LOOP_UVLOOP = "uvloop"
+LOOP_AUTO = "auto"
+LOOP_CHOICES = (LOOP_ASYNCIO, LOOP_UVLOOP, LOOP_AUTO)
+
+# Environment variables giving the defaults of --loop and --eager-tasks.
+LOOP_ENV = "MCP_LOOP"
+EAGER_TASKS_ENV = "MCP_EAGER_TASKS"
+
+def loop_factory(loop=LOOP_ASYNCIO, eager_tasks=False):
+    """
+    Return a function creating the event loop selected by 'loop' (one of
+    LOOP_CHOICES), for asyncio.run(loop_factory=...), or None for the
+    default loop.
+
+    With 'eager_tasks', the loop uses asyncio.eager_task_factory: a new
+    task runs synchronously until its first suspension, so a dispatched
+    request that completes without waiting never goes through the loop's
+    scheduling queue.
+    """
+    if loop not in LOOP_CHOICES:
+        raise ValueError(f"Unknown event loop {loop!r}, expected one of {', '.join(LOOP_CHOICES)}")
+    if loop == LOOP_UVLOOP and uvloop is None:
+        raise ValueError("uvloop is not installed")
+    use_uvloop = loop == LOOP_UVLOOP or (loop == LOOP_AUTO and uvloop is not None)
+    if not use_uvloop and not eager_tasks:
+        return None
+
+    def new_event_loop():
+        event_loop = uvloop.new_event_loop() if use_uvloop else asyncio.new_event_loop()
+        if eager_tasks:
+            event_loop.set_task_factory(asyncio.eager_task_factory)
+        return event_loop
+    return new_event_loop
+
+def run(main, loop_factory=None):
+    """
+    asyncio.run(main) on a loop from 'loop_factory' (see loop_factory()).
+    """
+    return asyncio.run(main, loop_factory=loop_factory)
+
+def loop_variants():
+    """
+    Return the (loop, eager_tasks) combinations available here, for
+    benchmarking them against each other.
+    """
+    loops = (LOOP_ASYNCIO, LOOP_UVLOOP) if uvloop is not None else (LOOP_ASYNCIO,)
+    return [(loop, eager_tasks) for loop in loops for eager_tasks in (False, True)]
+
+def env_flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+def parse_loop(value):
+    """
+    Check a --loop value, including a default taken from $MCP_LOOP, so a
+    bad one is reported as a usage error.
+    """
+    if value not in LOOP_CHOICES:
+        raise argparse.ArgumentTypeError(f"invalid choice {value!r} (${LOOP_ENV} or --loop must be one of "
+                                         f"{', '.join(LOOP_CHOICES)})")
+    if value == LOOP_UVLOOP and uvloop is None:
+        raise argparse.ArgumentTypeError("uvloop is not installed")
+    return value
+
+def add_loop_arguments(parser):
+    # argparse runs 'type' on string defaults too, so $MCP_LOOP is checked.
+    parser.add_argument('--loop', type=parse_loop, choices=LOOP_CHOICES,
+                        default=os.environ.get(LOOP_ENV, LOOP_ASYNCIO),
+                        help=f'Event loop implementation; "auto" uses uvloop when it is installed '
+                             f'(default: ${LOOP_ENV} or asyncio)')
+    parser.add_argument('--eager-tasks', action=argparse.BooleanOptionalAction, default=env_flag(EAGER_TASKS_ENV),
+                        help=f'Start tasks eagerly with asyncio.eager_task_factory (default: ${EAGER_TASKS_ENV})')
+
+def loop_from_args(args):
+    """
+    Return the loop factory selected by parsed arguments.
+    """
+    return loop_factory(args.loop, args.eager_tasks)
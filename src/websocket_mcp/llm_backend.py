@@ -0,0 +1,287 @@
+import asyncio
+import collections
+import time
+
+# Import the ollama package.
+import ollama
+
+from .scheduler import GenerationScheduler, PRIORITY_NORMAL
+from . import tracing
+
+# Number of generations run against the model host at once. Ollama serves
+# one request per loaded model by default (OLLAMA_NUM_PARALLEL).
+DEFAULT_LLM_SLOTS = 1
+
+# Seconds a cached model list is served before a background refresh.
+DEFAULT_INVENTORY_TTL = 30.0
+
+# Seconds between checks of which models ollama holds in memory.
+DEFAULT_RESIDENCY_INTERVAL = 10.0
+
+# ollama keep_alive values: keep a model loaded indefinitely, or unload it now.
+KEEP_LOADED = -1
+UNLOAD = 0
+
+def full_model_name(model):
+    """
+    Return 'model' with an explicit tag; ollama reads a bare name as ":latest".
+    """
+    return model if ":" in model else model + ":latest"
+
+def parse_models(value):
+    """
+    Parse a comma-separated model list, e.g. from the --preload option.
+    """
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+def is_model_not_found(error):
+    """
+    Return True if 'error' is ollama reporting an unknown model.
+    """
+    return isinstance(error, ollama.ResponseError) and error.status_code == 404
+
+class OllamaBackend:
+    """
+    Asynchronous access to a local Ollama instance.
+
+    Generations go through ollama.AsyncClient so they never block the event
+    loop, and a GenerationScheduler bounds how many run at once to the
+    number of slots the model host actually has. Excess callers queue by
+    'priority' and take turns by 'owner' (their connection).
+    """
+    def __init__(self, host=None, slots=DEFAULT_LLM_SLOTS, scheduler=None):
+        self.client = ollama.AsyncClient(host=host)
+        self.scheduler = scheduler or GenerationScheduler(slots)
+        self.keeper = None  # Optional ModelKeeper tracking model residency
+
+    def keep_alive(self, model):
+        """
+        Note that 'model' is being used and return the keep_alive to send
+        with it; ollama resets a model's keep_alive on every request.
+        """
+        if self.keeper is None:
+            return None
+        return self.keeper.used(model)
+
+    async def generate(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        """
+        Generate a complete answer for 'prompt' and return the response text.
+        'options' are ollama generation options such as temperature or seed.
+        """
+        async with self.scheduler.slot(model, priority, owner):
+            with tracing.span("ollama.generate", model=model):
+                response = await self.client.generate(model=model, prompt=prompt, options=options,
+                                                      keep_alive=self.keep_alive(model))
+        return response['response']
+
+    async def stream(self, model, prompt, options=None, priority=PRIORITY_NORMAL, owner=None):
+        """
+        Generate an answer for 'prompt', yielding text chunks as the model
+        produces them. The slot is held until the stream is exhausted.
+        Closing the generator early (e.g. on cancellation) closes the HTTP
+        response, which makes ollama abort the generation.
+        """
+        async with self.scheduler.slot(model, priority, owner):
+            with tracing.detached_span("ollama.generate", model=model, stream=True):
+                parts = await self.client.generate(model=model, prompt=prompt, options=options, stream=True,
+                                                   keep_alive=self.keep_alive(model))
+                try:
+                    async for part in parts:
+                        if part['response']:
+                            yield part['response']
+                finally:
+                    await parts.aclose()
+
+    async def list_models(self):
+        """
+        Return the names of the models available to ollama.
+        """
+        return list(await self.model_digests())
+
+    async def model_digests(self):
+        """
+        Return {model name: content digest} for the models available to ollama.
+        """
+        models_response = await self.client.list()
+        return {model.model: model.digest for model in models_response.models}
+
+    async def load(self, model, keep_alive=None):
+        """
+        Load 'model' into memory without generating anything.
+        """
+        await self.client.generate(model=model, keep_alive=keep_alive)
+
+    async def unload(self, model):
+        await self.client.generate(model=model, keep_alive=UNLOAD)
+
+    async def loaded_models(self):
+        """
+        Return {model name: size in bytes} for the models ollama has in memory.
+        """
+        process_response = await self.client.ps()
+        return {model.model: model.size for model in process_response.models}
+
+class ModelInventory:
+    """
+    Process-wide cache of the model names returned by a backend.
+
+    get() only waits for ollama when nothing has been fetched yet. Once the
+    list is older than 'ttl' seconds it is still returned immediately while
+    a single background task refreshes it; concurrent callers share that
+    task. If a refresh fails the error is logged and the previous list is
+    kept; only a get() waiting for the first list raises it.
+    """
+    def __init__(self, backend, ttl=DEFAULT_INVENTORY_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.models = None
+        self.digests = {}
+        self.fetched_at = 0.0
+        self.refresh_task = None
+
+    async def get(self):
+        if self.models is None:
+            error = await asyncio.shield(self.schedule_refresh())
+            if error is not None:
+                raise error
+        elif time.monotonic() - self.fetched_at > self.ttl:
+            self.schedule_refresh()
+        return self.models
+
+    async def digest(self, model):
+        """
+        Return the content digest of 'model', or None if ollama does not
+        list it. A name without a tag matches the ":latest" tag, as in ollama.
+        """
+        await self.get()
+        return self.digests.get(full_model_name(model))
+
+    def invalidate(self):
+        """
+        Mark the list stale, e.g. after a request named a model ollama does
+        not know, and start refreshing it.
+        """
+        self.fetched_at = float("-inf")
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self.refresh())
+        return self.refresh_task
+
+    async def refresh(self):
+        """
+        Fetch the model list; return the error if that failed. The task
+        never raises, since background refreshes have no one awaiting them.
+        """
+        try:
+            digests = await self.backend.model_digests()
+        except Exception as e:
+            print(f"Error refreshing models: {e}")
+            return e
+        self.digests = digests
+        self.models = list(digests)
+        self.fetched_at = time.monotonic()
+        return None
+
+class ModelKeeper:
+    """
+    Manages which models ollama keeps in memory.
+
+    'pinned' models are loaded by start() and sent with keep_alive=-1, so
+    ollama never unloads them. Other models are loaded on first use and
+    tracked from least to most recently used; whenever the loaded models
+    take more than 'memory_budget' bytes, the least recently used
+    unpinned ones are unloaded. hot() lists the loaded models.
+    """
+    def __init__(self, backend, pinned=(), memory_budget=None, interval=DEFAULT_RESIDENCY_INTERVAL):
+        self.backend = backend
+        self.pinned = {full_model_name(model) for model in pinned}
+        self.memory_budget = memory_budget
+        self.interval = interval
+        self.loaded = {}                            # model -> bytes in memory
+        self.recent = collections.OrderedDict()     # model -> time of last use, least recent first
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.reachable = True
+        backend.keeper = self
+
+    async def start(self):
+        """
+        Load the pinned models, one at a time, then start tracking residency.
+        """
+        for model in sorted(self.pinned):
+            try:
+                await self.backend.load(model, keep_alive=KEEP_LOADED)
+                print(f"Preloaded model '{model}'")
+            except Exception as e:
+                print(f"Error preloading model '{model}': {e}")
+        await self.refresh()
+        self.task = asyncio.create_task(self.watch())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def used(self, model):
+        """
+        Record a use of 'model' and return the keep_alive to request it with.
+        """
+        model = full_model_name(model)
+        self.recent[model] = time.monotonic()
+        self.recent.move_to_end(model)
+        if model not in self.loaded:
+            # Ollama is loading a new model; check the budget soon.
+            self.wakeup.set()
+        return KEEP_LOADED if model in self.pinned else None
+
+    def hot(self):
+        return sorted(self.loaded)
+
+    async def watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+                # Give ollama a moment to load the model that woke us up.
+                await asyncio.sleep(1.0)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.refresh()
+
+    async def refresh(self):
+        try:
+            self.loaded = await self.backend.loaded_models()
+        except Exception as e:
+            if self.reachable:
+                print(f"Error checking loaded models: {e}")
+            self.reachable = False
+            return
+        self.reachable = True
+        # Forget models that are no longer loaded and have not been used lately.
+        now = time.monotonic()
+        for model in [model for model, last_used in self.recent.items()
+                      if model not in self.loaded and now - last_used > self.interval]:
+            del self.recent[model]
+        await self.enforce_budget()
+
+    async def enforce_budget(self):
+        if self.memory_budget is None:
+            return
+        used = sum(self.loaded.values())
+        # Models never used through this server count as least recent.
+        candidates = [model for model in self.loaded if model not in self.recent]
+        candidates += [model for model in self.recent if model in self.loaded]
+        for model in candidates:
+            if used <= self.memory_budget:
+                break
+            if model in self.pinned:
+                continue
+            try:
+                await self.backend.unload(model)
+            except Exception as e:
+                print(f"Error unloading model '{model}': {e}")
+                continue
+            print(f"Unloaded model '{model}' to stay within the memory budget")
+            used -= self.loaded.pop(model)
@@ -2,14 +2,20 @@ import argparse
 import asyncio
 import websockets
 from .mcp_client import MCPClient, websocket_transport_client
+from .compression import add_compression_arguments, compression_from_args
+from . import eventloop
+from .codec import get_codec, available_subprotocols, parse_subprotocols, CODEC_CHOICES
 
-async def run_llm_client(server_ip):
+async def run_llm_client(server_ip, codec=None, subprotocols=None, compression=None, timeout=None):
     uri = f"ws://{server_ip}:8766"  # The server running local_llm_server.py
-    client = MCPClient("llm-client", "1.0.0", capabilities={"llm": True})
+    client = MCPClient("llm-client", "1.0.0", capabilities={"llm": True}, timeout=timeout)
+    # Offer the given subprotocols; the server picks one it supports.
+    subprotocols = subprotocols or available_subprotocols()
     
     try:
-        async with websockets.connect(uri) as websocket:
-            async with websocket_transport_client(websocket) as (send_func, message_queue):
+        # 'compression' holds permessage-deflate options from compression.client_compression().
+        async with websockets.connect(uri, subprotocols=subprotocols, **(compression or {})) as websocket:
+            async with websocket_transport_client(websocket, codec=codec) as (send_func, message_queue):
                 # Set the client's send function.
                 client.send = send_func
 
@@ -21,7 +27,8 @@ async def run_llm_client(server_ip):
                 task = asyncio.create_task(process_messages())
 
                 # --- Initialization Handshake ---
-                await client.connect(send_func)
+                init_response = await client.connect(send_func)
+                print("Initialization response from server:", init_response)
 
                 # Retrieve and display available resources.
                 try:
@@ -48,12 +55,14 @@ async def run_llm_client(server_ip):
                 if model:
                     params["model"] = model
 
-                # Send the ask_llm request and wait for the response.
+                # Send the ask_llm request and print the answer as it streams in.
                 try:
-                    response = await client.request("ask_llm", params)
-                    print("LLM Response:", response)
+                    print("LLM Response: ", end="", flush=True)
+                    async for chunk in client.stream("ask_llm", params):
+                        print(chunk, end="", flush=True)
+                    print()
                 except Exception as e:
-                    print("Error in ask_llm request:", e)
+                    print("\nError in ask_llm request:", e)
 
                 # Initiate graceful shutdown.
                 try:
@@ -74,9 +83,20 @@ async def run_llm_client(server_ip):
 def main():
     parser = argparse.ArgumentParser(description="Run the LLM client.")
     parser.add_argument('--server-ip', default='127.0.0.1', help='IP address of the server to connect to')
+    parser.add_argument('--codec', choices=CODEC_CHOICES, default='auto',
+                        help='JSON library used to encode and decode messages')
+    parser.add_argument('--subprotocols', type=parse_subprotocols, default=None,
+                        help='Comma-separated subprotocols to offer, most preferred first '
+                             '(default: all installed, binary first)')
+    add_compression_arguments(parser)
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds to wait for each response or streamed chunk (default: no limit)')
+    eventloop.add_loop_arguments(parser)
     args = parser.parse_args()
 
-    asyncio.run(run_llm_client(args.server_ip))
+    eventloop.run(run_llm_client(args.server_ip, get_codec(args.codec), args.subprotocols,
+                                 compression_from_args(args, server=False), args.timeout),
+                  eventloop.loop_from_args(args))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
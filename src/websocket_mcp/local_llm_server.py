@@ -1,23 +1,51 @@
-import asyncio
+import argparse
+import contextlib
+import functools
 import json
 import anyio
 import websockets
 
 # Import the MCP server implementation.
-from .mcp_server import MCPServer, websocket_transport_server, JSON_RPC_VERSION
+from .mcp_server import (MCPServer, serve_connection, get_progress_token, start_metrics, start_tracing,
+                         start_watchdog, stop_profiler, add_trace_argument, JSON_RPC_VERSION, DEFAULT_MAX_CONCURRENCY)
+from .transport import DEFAULT_QUEUE_SIZE, OVERFLOW_BLOCK, OVERFLOW_POLICIES
+from .codec import get_codec, available_subprotocols, parse_subprotocols, CODEC_CHOICES
+from .transport import select_subprotocol
+from .compression import add_compression_arguments, compression_from_args
+from .workers import Drain, run_until_stopped, run_workers, DEFAULT_DRAIN_TIMEOUT
+from .sessions import SessionStore, DEFAULT_SESSION_TTL
+from .response_cache import ResponseCache, is_deterministic, cache_key
+from .coalescing import CoalescingBackend
+from .scheduler import GenerationScheduler, PRIORITIES, PRIORITY_NORMAL
+from .profiling import RequestProfiler, add_profiling_arguments, profiling_from_args
+from .watchdog import add_watchdog_argument
+from . import eventloop
 
-# Import the ollama package.
-import ollama
+# Import the asynchronous ollama backend.
+from .llm_backend import (OllamaBackend, ModelInventory, ModelKeeper, is_model_not_found, parse_models,
+                          DEFAULT_LLM_SLOTS, DEFAULT_INVENTORY_TTL)
 
 # --- LLM Request Handler using Ollama ---
 
-async def ask_llm_handler(params):
+async def ask_llm_handler(params, backend, server, inventory, cache=None):
     """
     Handles the "ask_llm" request.
     
     Expects a JSON-RPC request with parameters:
       - "prompt": the prompt to send to the local LLM.
       - "model": (optional) the name of the LLM to use.
+      - "options": (optional) ollama generation options, e.g. {"temperature": 0}.
+      - "priority": (optional) "high", "normal" (default) or "low"; decides
+        the order in which queued generations start.
+      - "_meta": (optional) {"progressToken": token} to stream the answer.
+      
+    When a progress token is given, each generated chunk is sent as a
+    "notifications/progress" message carrying the token, a running chunk
+    count and the "chunk" text, before the final result.
+    
+    With a response 'cache', deterministic requests (temperature 0 or a
+    fixed seed) are answered from it when possible; a cached answer is
+    streamed as a single chunk and the result is marked "cached".
       
     Returns:
       A dict with the LLM answer.
@@ -26,36 +54,70 @@ async def ask_llm_handler(params):
     if not prompt:
         raise ValueError("Missing 'prompt' parameter")
     model = params.get("model", "deepseek-r1:7b")  # use a default model if none provided
+    options = params.get("options")
+    if options is not None and not isinstance(options, dict):
+        raise ValueError("'options' must be an object")
+    priority = params.get("priority", PRIORITY_NORMAL)
+    if priority not in PRIORITIES:
+        raise ValueError(f"'priority' must be one of {', '.join(PRIORITIES)}")
 
     # Log the request details
     print(f"Request: '{prompt}', with model '{model}'")
 
     try:
-        response = ollama.generate(model=model, prompt=prompt)
+        progress_token = get_progress_token(params)
+        key = None
+        if cache is not None and is_deterministic(options):
+            # Key on the model digest; models ollama does not list are not cached.
+            digest = await inventory.digest(model)
+            if digest is not None:
+                key = cache_key(digest, prompt, options)
+                answer = await cache.get(key)
+                if answer is not None:
+                    if progress_token is not None:
+                        await server.send_progress(progress_token, 1, chunk=answer)
+                    return {"answer": answer, "cached": True}
+
+        if progress_token is None:
+            # The connection owns the request, so each gets a fair share of the model host.
+            answer = await backend.generate(model, prompt, options, priority, owner=server)
+        else:
+            chunks = []
+            # aclosing() stops the generation promptly if this request is cancelled.
+            async with contextlib.aclosing(backend.stream(model, prompt, options, priority, owner=server)) as stream:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    await server.send_progress(progress_token, len(chunks), chunk=chunk)
+            answer = "".join(chunks)
         
         # Log the response details
-        print(f"Response: '{response['response']}'")
+        print(f"Response: '{answer}'")
         
-        return {"answer": response['response']}
+        if key is not None:
+            await cache.put(key, answer)
+        return {"answer": answer}
     except Exception as e:
+        if is_model_not_found(e):
+            # The cached model list may be out of date.
+            inventory.invalidate()
         raise Exception(f"Ollama LLM error: {str(e)}")
 
 # --- List Resources Request Handler ---
 
-async def list_resources_handler(params):
+async def list_resources_handler(params, inventory, cache=None, scheduler=None, keeper=None):
     """
     Handles the "list_resources" request.
     
     Returns a list of available resources as defined by the MCP standard.
     In this case, it includes a resource for the local LLM service along with
-    a list of LLMs available to ollama.
+    a list of LLMs available to ollama, served from the model inventory cache,
+    the models currently loaded ("hot") so clients can prefer warm ones,
+    the generation queue metrics and the response cache counters when
+    caching is enabled.
     """
     try:
-        # Query ollama for a list of available models.
-        models_response = ollama.list()
-        
-        # Extract only the model names.
-        models = [model.model for model in models_response.models]
+        # Get the names of the available models.
+        models = await inventory.get()
     except Exception as e:
         print(f"Error fetching models: {e}")
         models = []  # Fallback to an empty list if the query fails.
@@ -68,43 +130,176 @@ async def list_resources_handler(params):
             "models": models
         }
     ]
+    if keeper is not None:
+        resources[0]["hot"] = keeper.hot()
+    if scheduler is not None:
+        resources[0]["queue"] = scheduler.metrics()
+    if cache is not None:
+        resources[0]["cache"] = cache.metrics()
     return resources
 
 # --- WebSocket Server Handler ---
 
-async def websocket_llm_server_handler(websocket):
+async def websocket_llm_server_handler(websocket, backend, inventory, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                                       drain=None, sessions=None, cache=None, scheduler=None, keeper=None,
+                                       metrics=None, traced=False, profiler=None, **transport_options):
     """
     Wraps an accepted WebSocket connection in an MCP server that exposes
     a local LLM via the ollama package.
     (Note: The 'path' parameter has been removed as it's no longer used in newer websockets versions.)
     """
-    # Create an MCP server instance with LLM capability.
-    server = MCPServer("local-llm-server", "1.0.0", capabilities={"llm": True})
-    
-    # Register the ask_llm and list_resources request handlers.
-    server.register_request_handler("ask_llm", ask_llm_handler)
-    server.register_request_handler("list_resources", list_resources_handler)
+    # Create an MCP server instance with LLM capability. Requests are
+    # dispatched concurrently so a slow generation does not stall the
+    # other requests on this connection.
+    server = MCPServer("local-llm-server", "1.0.0", capabilities={"llm": True},
+                       concurrent=True, max_concurrency=max_concurrency, sessions=sessions, metrics=metrics,
+                       traced=traced, profiler=profiler)
+    register_llm_handlers(server, backend, inventory, cache, scheduler, keeper)
     
-    async with websocket_transport_server(websocket) as (send_func, message_queue):
-        server.send = send_func
-        # Process incoming messages until a shutdown is triggered.
-        while not server.shutdown_event.is_set():
-            try:
-                message = await asyncio.wait_for(message_queue.get(), timeout=1)
-                await server.receive(message)
-            except asyncio.TimeoutError:
-                continue
+    # Process incoming messages until a shutdown is triggered.
+    await serve_connection(server, websocket, drain, **transport_options)
+
+def register_llm_handlers(server, backend, inventory, cache=None, scheduler=None, keeper=None):
+    """
+    Register the ask_llm and list_resources request handlers on 'server'.
+    """
+    server.register_request_handler("ask_llm", functools.partial(ask_llm_handler, backend=backend, server=server,
+                                                                 inventory=inventory, cache=cache))
+    server.register_request_handler("list_resources", functools.partial(list_resources_handler, inventory=inventory,
+                                                                        cache=cache, scheduler=scheduler,
+                                                                        keeper=keeper))
 
 # --- Server Startup ---
 
-async def start_local_llm_server():
-    # Use port 8766 to avoid conflicts with other MCP servers.
-    async with websockets.serve(websocket_llm_server_handler, "", 8766):  # Bind to all interfaces
+async def start_local_llm_server(max_concurrency=DEFAULT_MAX_CONCURRENCY, llm_slots=DEFAULT_LLM_SLOTS,
+                                 model_slots=None, models_ttl=DEFAULT_INVENTORY_TTL, subprotocols=None,
+                                 compression=None, reuse_port=False, drain_timeout=DEFAULT_DRAIN_TIMEOUT,
+                                 session_ttl=DEFAULT_SESSION_TTL, cache_size=0, cache_path=None, coalesce=False,
+                                 preload=(), models_memory=None, metrics_port=None, trace=None, profiling=None,
+                                 block_threshold=None, worker=0, **transport_options):
+    # One backend and model inventory are shared by every connection so the
+    # slot limits and the cached model list apply to the whole process.
+    scheduler = GenerationScheduler(llm_slots, model_slots)
+    backend = OllamaBackend(scheduler=scheduler)
+    inventory = ModelInventory(backend, ttl=models_ttl)
+    # Load and pin the 'preload' models before accepting connections. Without
+    # either option there is nothing to manage, so ollama is not polled.
+    keeper = None
+    if preload or models_memory is not None:
+        keeper = ModelKeeper(backend, pinned=preload, memory_budget=models_memory)
+        await keeper.start()
+    if coalesce:
+        # Identical concurrent ask_llm calls share one generation.
+        backend = CoalescingBackend(backend)
+    drain = Drain(drain_timeout)
+    sessions = SessionStore(session_ttl)
+    metrics = await start_metrics(metrics_port, worker)
+    watchdog = start_watchdog(block_threshold, metrics)
+    traced = start_tracing(trace)
+    # 'profiling' holds RequestProfiler options from profiling.profiling_from_args().
+    profiler = RequestProfiler(**profiling) if profiling else None
+    # The response cache is opt-in: a memory budget or a database path enables it.
+    cache = ResponseCache(cache_size, cache_path) if cache_size or cache_path else None
+    if metrics is not None:
+        metrics.track_scheduler(scheduler)
+        if cache is not None:
+            metrics.track_cache(cache)
+    handler = functools.partial(websocket_llm_server_handler, backend=backend, inventory=inventory,
+                                max_concurrency=max_concurrency, drain=drain, sessions=sessions, cache=cache,
+                                scheduler=scheduler, keeper=keeper, metrics=metrics, traced=traced,
+                                profiler=profiler, **transport_options)
+    # Offer the given subprotocols in order of preference, binary ones first by default.
+    subprotocols = subprotocols or available_subprotocols()
+    # Use port 8766 to avoid conflicts with other MCP servers. 'compression'
+    # holds permessage-deflate options from compression.server_compression().
+    # 'reuse_port' lets several worker processes bind the same port.
+    async with websockets.serve(handler, "", 8766,  # Bind to all interfaces
+                                subprotocols=subprotocols, select_subprotocol=select_subprotocol,
+                                reuse_port=reuse_port, **(compression or {})) as ws_server:
         print("Local LLM MCP Server running on ws://0.0.0.0:8766")
-        await asyncio.Future()  # Run indefinitely
+        # Serve until SIGTERM/SIGINT, then drain.
+        try:
+            await run_until_stopped(ws_server, drain)
+        finally:
+            if keeper is not None:
+                await keeper.close()
+            if cache is not None:
+                cache.close()
+            stop_profiler(profiler)
+            if watchdog is not None:
+                await watchdog.stop()
 
 def main():
-    asyncio.run(start_local_llm_server())
+    parser = argparse.ArgumentParser(description="Run the local LLM MCP server.")
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help='Maximum number of requests handled concurrently per connection')
+    parser.add_argument('--llm-slots', type=int, default=DEFAULT_LLM_SLOTS,
+                        help='Number of generations the model host can run at once, per worker process')
+    parser.add_argument('--model-slots', type=int, default=None,
+                        help='Maximum generations of any one model at once (default: --llm-slots)')
+    parser.add_argument('--models-ttl', type=float, default=DEFAULT_INVENTORY_TTL,
+                        help='Seconds to serve the cached model list before refreshing it')
+    parser.add_argument('--preload', type=parse_models, default=[],
+                        help='Comma-separated models to load at startup and keep loaded, e.g. deepseek-r1:7b')
+    parser.add_argument('--models-memory', type=int, default=None,
+                        help='Bytes the loaded models may use; least recently used unpinned models are unloaded')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Maximum number of received messages buffered per connection')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=OVERFLOW_BLOCK,
+                        help='What to do with incoming messages when the buffer is full')
+    parser.add_argument('--codec', choices=CODEC_CHOICES, default='auto',
+                        help='JSON library used to encode and decode messages')
+    parser.add_argument('--subprotocols', type=parse_subprotocols, default=None,
+                        help='Comma-separated subprotocols to negotiate, most preferred first '
+                             '(default: all installed, binary first)')
+    add_compression_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes sharing the port via SO_REUSEPORT')
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help='Seconds in-flight requests may take to finish on shutdown')
+    parser.add_argument('--session-ttl', type=float, default=DEFAULT_SESSION_TTL,
+                        help='Seconds a session is kept after its connection drops, for resumption')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='Bytes of deterministic ask_llm answers cached in memory (0 disables the memory tier)')
+    parser.add_argument('--cache-db', default=None,
+                        help='SQLite file that persists cached answers across restarts')
+    parser.add_argument('--coalesce', action='store_true',
+                        help='Share one generation between identical concurrent ask_llm calls')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on this port (worker N of --workers uses port + N)')
+    add_trace_argument(parser)
+    add_profiling_arguments(parser)
+    add_watchdog_argument(parser)
+    eventloop.add_loop_arguments(parser)
+    args = parser.parse_args()
+
+    options = dict(
+        max_concurrency=args.max_concurrency,
+        llm_slots=args.llm_slots,
+        model_slots=args.model_slots,
+        models_ttl=args.models_ttl,
+        preload=args.preload,
+        models_memory=args.models_memory,
+        subprotocols=args.subprotocols,
+        compression=compression_from_args(args, server=True),
+        drain_timeout=args.drain_timeout,
+        session_ttl=args.session_ttl,
+        cache_size=args.cache_size,
+        cache_path=args.cache_db,
+        coalesce=args.coalesce,
+        metrics_port=args.metrics_port,
+        trace=args.trace,
+        profiling=profiling_from_args(args),
+        block_threshold=args.block_threshold,
+        max_queue=args.max_queue,
+        overflow=args.overflow,
+        codec=get_codec(args.codec),
+    )
+    loop_factory = eventloop.loop_from_args(args)
+    if args.workers > 1:
+        run_workers(start_local_llm_server, args.workers, loop_factory=loop_factory, **options)
+    else:
+        eventloop.run(start_local_llm_server(**options), loop_factory)
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,15 @@
 import argparse
 import asyncio
-import json
 import anyio
 import websockets
 from contextlib import asynccontextmanager
 
+from .compression import add_compression_arguments, compression_from_args
+from . import eventloop
+from .codec import get_codec, codec_for_subprotocol, available_subprotocols, parse_subprotocols, CODEC_CHOICES
+from .transport import MessageQueue, CONNECTION_CLOSED, DEFAULT_QUEUE_SIZE, OVERFLOW_BLOCK
+from . import tracing
+
 JSON_RPC_VERSION = "2.0"
 
 def create_request(method, params, id):
@@ -22,42 +27,240 @@ def create_notification(method, params):
         "params": params,
     }
 
+# Notification carrying incremental output for a streaming request.
+PROGRESS_NOTIFICATION = "notifications/progress"
+
+# Notification asking the server to stop working on a request.
+CANCELLED_NOTIFICATION = "notifications/cancelled"
+
+# Marks the end of a ResponseStream's chunk queue.
+_STREAM_END = object()
+
+class ResponseStream:
+    """
+    Async iterator over the chunks of a streaming request.
+
+    The request is sent on the first iteration. Each progress notification
+    tied to the request yields its "chunk"; iteration stops once the final
+    response arrives, which is then available as 'result'. An error
+    response is raised from the iterator. If the iterating task is
+    cancelled, or no chunk or response arrives within 'timeout' seconds
+    (default: the client's timeout), the request is cancelled on the
+    server too; a timeout raises TimeoutError.
+    """
+    def __init__(self, client, method, params, timeout=None):
+        self.client = client
+        self.method = method
+        self.params = params
+        self.timeout = client.timeout if timeout is None else timeout
+        self.chunks = asyncio.Queue()
+        self.req_id = None
+        self.future = None
+        self.result = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.future is None:
+            self.req_id, self.future = await self.client.start_stream(self)
+        try:
+            chunk = await asyncio.wait_for(self.chunks.get(), self.timeout)
+        except TimeoutError:
+            reason = f"No output for {self.timeout} seconds"
+            self.client.abandon(self.req_id, reason)
+            raise TimeoutError(reason) from None
+        except asyncio.CancelledError:
+            self.client.abandon(self.req_id, "Stream cancelled")
+            raise
+        if chunk is _STREAM_END:
+            self.result = self.future.result()
+            raise StopAsyncIteration
+        return chunk
+
 class MCPClient:
-    def __init__(self, name, version, capabilities=None):
+    def __init__(self, name, version, capabilities=None, timeout=None, traced=False):
+        """
+        'timeout' is the default number of seconds to wait for a response,
+        or None to wait indefinitely. It can be overridden per request.
+
+        When 'traced' is true, requests carry the current OpenTelemetry
+        trace context in their "_meta", and request() runs in a client span.
+        """
+        if traced:
+            tracing.check_available()
         self.name = name
         self.version = version
         self.capabilities = capabilities or {}
+        self.timeout = timeout
         self.send = None  # Set once the transport is connected
+        self.server_info = None  # Result of the initialize request
+        self.session_id = None  # Server-issued session id, sent back when reconnecting
         self.pending = {}  # Map request id to asyncio.Future
+        self.streams = {}  # Map request id to ResponseStream
+        self.background = set()  # Cancel notifications being sent
+        self.notification_handlers = {}
         self.next_id = 1
+        self.traced = traced
+
+    def register_notification_handler(self, method, handler):
+        """
+        Handle server notifications of 'method' with 'await handler(params)'
+        instead of the default logging.
+        """
+        self.notification_handlers[method] = handler
 
     async def connect(self, send_func):
+        """
+        Run the initialization handshake and return the server's response.
+        
+        If the server issued a session id on an earlier connection, it is
+        sent back so the server can resume that session.
+        """
         self.send = send_func
         # --- Initialization Handshake ---
-        init_id = self.next_id
-        self.next_id += 1
-        init_request = create_request("initialize", {
+        init_params = {
             "clientName": self.name,
             "clientVersion": self.version,
             "capabilities": self.capabilities
-        }, init_id)
-        await self.send(init_request)
-        fut = asyncio.get_event_loop().create_future()
-        self.pending[init_id] = fut
-        init_response = await fut
-        print("Initialization response from server:", init_response)
+        }
+        if self.session_id is not None:
+            init_params["sessionId"] = self.session_id
+        self.server_info = await self.request("initialize", init_params)
+        self.session_id = self.server_info.get("sessionId")
         # Send an "initialized" notification.
         init_notification = create_notification("initialized", {"status": "ok"})
         await self.send(init_notification)
+        return self.server_info
 
-    async def request(self, method, params):
+    def create_pending(self, method, params):
+        """
+        Allocate a request id and register a future for its response.
+        Returns the id, the request message and the future.
+        """
         req_id = self.next_id
         self.next_id += 1
-        req_msg = create_request(method, params, req_id)
-        fut = asyncio.get_event_loop().create_future()
+        if self.traced:
+            params = tracing.inject(params)
+        fut = asyncio.get_running_loop().create_future()
         self.pending[req_id] = fut
-        await self.send(req_msg)
-        return await fut
+        return req_id, create_request(method, params, req_id), fut
+
+    async def send_pending(self, message, req_ids):
+        # Forget the requests if they could not be sent.
+        try:
+            await self.send(message)
+        except BaseException:
+            for req_id in req_ids:
+                self.pending.pop(req_id, None)
+                self.streams.pop(req_id, None)
+            raise
+
+    async def wait_response(self, req_id, fut, timeout=None):
+        """
+        Wait for the response to 'req_id'.
+
+        If no response arrives within 'timeout' seconds (default: the
+        client's timeout), or the waiting task is cancelled, the request is
+        forgotten and the server is told to cancel it.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except TimeoutError:
+            self.abandon(req_id, f"Timed out after {timeout} seconds")
+            raise
+        except asyncio.CancelledError:
+            self.abandon(req_id, "Request cancelled")
+            raise
+
+    def abandon(self, req_id, reason):
+        """
+        Forget a request that is still pending and send a cancel
+        notification for it in the background.
+        """
+        fut = self.pending.pop(req_id, None)
+        self.streams.pop(req_id, None)
+        if fut is None:
+            return
+        if not fut.done():
+            fut.cancel()
+        task = asyncio.create_task(self.cancel_request(req_id, reason))
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def cancel_request(self, req_id, reason):
+        try:
+            await self.notify(CANCELLED_NOTIFICATION, {"requestId": req_id, "reason": reason})
+        except Exception:
+            pass  # The connection is gone; nothing left to cancel.
+
+    def connection_lost(self, exc=None):
+        """
+        Fail every pending request; called once the transport has closed.
+        """
+        exc = exc or ConnectionError("Connection closed")
+        pending, self.pending = self.pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        streams, self.streams = self.streams, {}
+        for stream in streams.values():
+            stream.chunks.put_nowait(_STREAM_END)
+
+    async def request(self, method, params, timeout=None):
+        if self.traced:
+            with tracing.client_span(method):
+                return await self.send_request(method, params, timeout)
+        return await self.send_request(method, params, timeout)
+
+    async def send_request(self, method, params, timeout=None):
+        req_id, req_msg, fut = self.create_pending(method, params)
+        await self.send_pending(req_msg, [req_id])
+        return await self.wait_response(req_id, fut, timeout)
+
+    async def request_batch(self, calls, return_exceptions=False, timeout=None):
+        """
+        Send several requests in one JSON-RPC batch frame.
+        
+        'calls' is a list of (method, params) pairs. Returns their results in
+        the same order. As with asyncio.gather, the first error is raised
+        unless 'return_exceptions' is true, in which case errors are
+        returned in place of results. 'timeout' applies to each request.
+        """
+        batch = []
+        waits = []
+        for method, params in calls:
+            req_id, req_msg, fut = self.create_pending(method, params)
+            batch.append(req_msg)
+            waits.append((req_id, fut))
+        await self.send_pending(batch, [req_id for req_id, _ in waits])
+        return await asyncio.gather(*(self.wait_response(req_id, fut, timeout) for req_id, fut in waits),
+                                    return_exceptions=return_exceptions)
+
+    def stream(self, method, params, timeout=None):
+        """
+        Send a request whose output is streamed back as progress notifications.
+        'timeout' limits the wait for each chunk and for the final response
+        (default: the client's timeout), so a long answer that keeps
+        streaming is not cut off.
+
+        Usage:
+          stream = client.stream("ask_llm", {"prompt": "..."})
+          async for chunk in stream:
+              ...
+          print(stream.result)
+        """
+        return ResponseStream(self, method, params, timeout)
+
+    async def start_stream(self, stream):
+        req_id, req_msg, fut = self.create_pending(stream.method, dict(stream.params))
+        params = req_msg["params"]
+        # The request id doubles as the progress token.
+        params["_meta"] = {**params.get("_meta", {}), "progressToken": req_id}
+        self.streams[req_id] = stream
+        await self.send_pending(req_msg, [req_id])
+        return req_id, fut
 
     async def notify(self, method, params):
         note_msg = create_notification(method, params)
@@ -68,7 +271,16 @@ class MCPClient:
         Process an incoming JSON-RPC message.
         
         Distinguishes between responses (with an "id") and notifications.
+        A batch response (a list) is processed member by member, and the
+        transport's CONNECTION_CLOSED marker fails all pending requests.
         """
+        if message is CONNECTION_CLOSED:
+            self.connection_lost()
+            return
+        if isinstance(message, list):
+            for member in message:
+                await self.receive(member)
+            return
         if not isinstance(message, dict):
             return
         if message.get("jsonrpc") != JSON_RPC_VERSION:
@@ -78,60 +290,97 @@ class MCPClient:
             req_id = message["id"]
             if req_id in self.pending:
                 fut = self.pending.pop(req_id)
-                if "result" in message:
+                if fut.done():
+                    pass
+                elif "result" in message:
                     fut.set_result(message["result"])
                 elif "error" in message:
                     fut.set_exception(Exception(message["error"]))
+                stream = self.streams.pop(req_id, None)
+                if stream is not None:
+                    stream.chunks.put_nowait(_STREAM_END)
         elif "method" in message:
             # Process server notifications.
             method = message["method"]
             params = message.get("params", {})
-            if method == "stream_data_chunk":
+            if method == PROGRESS_NOTIFICATION:
+                stream = self.streams.get(params.get("progressToken"))
+                if stream is not None:
+                    stream.chunks.put_nowait(params.get("chunk"))
+            elif method in self.notification_handlers:
+                await self.notification_handlers[method](params)
+            elif method == "stream_data_chunk":
                 print(f"Stream chunk received: {params}")
             elif method == "stream_complete":
                 print(f"Stream complete: {params}")
             # Additional notifications can be handled here.
 
 @asynccontextmanager
-async def websocket_transport_client(websocket):
+async def websocket_transport_client(websocket, max_queue=DEFAULT_QUEUE_SIZE, overflow=OVERFLOW_BLOCK, codec=None,
+                                     metrics=None):
     """
     Wrap a WebSocket connection into a transport context.
     
+    At most 'max_queue' received messages are buffered; 'overflow' selects
+    what happens when the buffer is full (see transport.MessageQueue).
+    Responses are never dropped. Messages are encoded with the codec of the
+    negotiated binary subprotocol, if any; otherwise with the JSON 'codec',
+    by default the fastest installed JSON library (see codec.get_codec).
+    With a metrics.MCPMetrics, the connection, its queue, frames and bytes
+    are recorded.
+    
     Yields:
       send_func: Function to send JSON-RPC messages.
-      queue: An asyncio.Queue of received messages.
+      queue: A MessageQueue of received messages.
     """
+    codec = codec_for_subprotocol(websocket.subprotocol, codec)
     async with anyio.create_task_group() as tg:
-        queue = asyncio.Queue()
+        queue = MessageQueue(max_queue, overflow)
+        if metrics is not None:
+            metrics.connection_opened(queue)
 
         async def receive_loop():
             try:
                 while True:
-                    message_text = await websocket.recv()
+                    data = await websocket.recv(decode=False)
+                    if metrics is not None:
+                        metrics.messages_in.inc()
+                        metrics.bytes_in.inc(len(data))
                     try:
-                        message = json.loads(message_text)
-                    except json.JSONDecodeError:
+                        message = codec.decode(data)
+                    except ValueError:
                         continue
-                    await queue.put(message)
+                    await queue.offer(message)
             except Exception:
                 pass
+            await queue.put(CONNECTION_CLOSED)
 
         tg.start_soon(receive_loop)
 
         async def send_message(message):
-            payload = json.dumps(message)
-            await websocket.send(payload)
+            payload = codec.encode(message)
+            if metrics is not None:
+                metrics.messages_out.inc()
+                metrics.bytes_out.inc(len(payload))
+            await websocket.send(payload, text=codec.text)
 
         try:
             yield send_message, queue
         finally:
-            tg.cancel_scope.cancel()
+            if metrics is not None:
+                metrics.connection_closed(queue)
+            # Close before cancelling: awaiting inside the cancelled scope
+            # would replace an exception raised by the caller.
             await websocket.close()
+            tg.cancel_scope.cancel()
 
-async def websocket_client(uri):
-    async with websockets.connect(uri) as websocket:
-        client = MCPClient("example-client", "1.0.0", capabilities={"streaming": True})
-        async with websocket_transport_client(websocket) as (send_func, message_queue):
+async def websocket_client(uri, codec=None, subprotocols=None, compression=None, timeout=None):
+    # Offer the given subprotocols; the server picks one it supports.
+    subprotocols = subprotocols or available_subprotocols()
+    # 'compression' holds permessage-deflate options from compression.client_compression().
+    async with websockets.connect(uri, subprotocols=subprotocols, **(compression or {})) as websocket:
+        client = MCPClient("example-client", "1.0.0", capabilities={"streaming": True}, timeout=timeout)
+        async with websocket_transport_client(websocket, codec=codec) as (send_func, message_queue):
             client.send = send_func
 
             # Background task to process incoming messages.
@@ -142,7 +391,8 @@ async def websocket_client(uri):
             task = asyncio.create_task(process_messages())
 
             # --- Initialization Handshake ---
-            await client.connect(send_func)
+            init_response = await client.connect(send_func)
+            print("Initialization response from server:", init_response)
 
             # Make a request for listing resources.
             try:
@@ -174,17 +424,28 @@ async def websocket_client(uri):
             except asyncio.CancelledError:
                 pass
 
-async def start_mcp_client(server_ip):
+async def start_mcp_client(server_ip, codec=None, subprotocols=None, compression=None, timeout=None):
     uri = f"ws://{server_ip}:8765"
     print("Connecting to MCP server at", uri)
-    await websocket_client(uri)
+    await websocket_client(uri, codec, subprotocols, compression, timeout)
 
 def main():
     parser = argparse.ArgumentParser(description="Run the MCP client.")
     parser.add_argument('--server-ip', default='127.0.0.1', help='IP address of the server to connect to')
+    parser.add_argument('--codec', choices=CODEC_CHOICES, default='auto',
+                        help='JSON library used to encode and decode messages')
+    parser.add_argument('--subprotocols', type=parse_subprotocols, default=None,
+                        help='Comma-separated subprotocols to offer, most preferred first '
+                             '(default: all installed, binary first)')
+    add_compression_arguments(parser)
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds to wait for each response (default: no limit)')
+    eventloop.add_loop_arguments(parser)
     args = parser.parse_args()
 
-    asyncio.run(start_mcp_client(args.server_ip))
+    eventloop.run(start_mcp_client(args.server_ip, get_codec(args.codec), args.subprotocols,
+                                   compression_from_args(args, server=False), args.timeout),
+                  eventloop.loop_from_args(args))
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,23 @@
+import argparse
 import asyncio
-import json
+import functools
+import time
 import anyio
 import websockets
 from contextlib import asynccontextmanager
 
+from .compression import add_compression_arguments, compression_from_args
+from .workers import Drain, run_until_stopped, run_workers, DEFAULT_DRAIN_TIMEOUT
+from .sessions import SessionStore, DEFAULT_SESSION_TTL
+from .metrics import MCPMetrics, serve_metrics
+from . import tracing
+from .watchdog import LoopWatchdog, add_watchdog_argument
+from . import eventloop
+from .profiling import RequestProfiler, ADMIN_PROFILING_METHOD, add_profiling_arguments, profiling_from_args
+from .codec import EncodeError, get_codec, codec_for_subprotocol, available_subprotocols, parse_subprotocols, CODEC_CHOICES
+from .transport import (MessageQueue, select_subprotocol, CONNECTION_CLOSED, DEFAULT_QUEUE_SIZE,
+                        OVERFLOW_BLOCK, OVERFLOW_POLICIES)
+
 JSON_RPC_VERSION = "2.0"
 
 # Standard JSON-RPC error codes
@@ -13,6 +27,25 @@ METHOD_NOT_FOUND = -32601
 INVALID_PARAMS = -32602
 INTERNAL_ERROR = -32603
 
+# Implementation-defined server error: the receive queue is full.
+SERVER_BUSY = -32000
+
+# Every error code the server sends, preallocated as metric labels.
+ERROR_CODES = (PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, INTERNAL_ERROR, SERVER_BUSY)
+
+# Notification carrying incremental output for a request that supplied
+# "_meta": {"progressToken": ...} in its params.
+PROGRESS_NOTIFICATION = "notifications/progress"
+
+# Notification asking the server to stop working on a request.
+CANCELLED_NOTIFICATION = "notifications/cancelled"
+
+# Methods answered by MCPServer itself rather than a registered handler.
+BUILTIN_METHODS = ("initialize", "shutdown", CANCELLED_NOTIFICATION)
+
+# Default cap on concurrently running requests per connection.
+DEFAULT_MAX_CONCURRENCY = 32
+
 def create_error_response(id, code, message, data=None):
     return {
         "jsonrpc": JSON_RPC_VERSION,
@@ -31,8 +64,89 @@ def create_response(id, result):
         "result": result,
     }
 
+def create_notification(method, params):
+    return {
+        "jsonrpc": JSON_RPC_VERSION,
+        "method": method,
+        "params": params,
+    }
+
+def encodable_responses(codec, message):
+    """
+    Return 'message', a response or a batch of them, with every response
+    'codec' cannot encode replaced by an INTERNAL_ERROR for its id, so the
+    client still gets an answer. Batch members are checked one by one.
+    Raises EncodeError for anything else, e.g. a notification.
+    """
+    if isinstance(message, list):
+        return [encodable_responses(codec, member) for member in message]
+    try:
+        codec.encode(message)
+    except EncodeError as e:
+        if not isinstance(message, dict) or "id" not in message or "method" in message:
+            raise
+        return create_error_response(message["id"], INTERNAL_ERROR, str(e))
+    return message
+
+def is_valid_id(req_id):
+    """
+    Return True if 'req_id' may identify a JSON-RPC request: a string, a
+    number or null.
+    """
+    return req_id is None or (isinstance(req_id, (str, int, float)) and not isinstance(req_id, bool))
+
+def report_task_error(task):
+    """
+    Done callback retrieving the exception of a request or batch task.
+    Sends that fail because the client went away are expected and ignored;
+    anything else is logged once.
+    """
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None and not isinstance(error, websockets.ConnectionClosed):
+        print(f"Request task failed: {error!r}")
+
+def get_progress_token(params):
+    """
+    Return the progress token a request asked to be streamed under, or None.
+    """
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    if isinstance(meta, dict):
+        return meta.get("progressToken")
+    return None
+
+def is_valid_message(message):
+    """
+    Return True if 'message' is a JSON-RPC request or notification.
+    """
+    return (isinstance(message, dict) and message.get("jsonrpc") == JSON_RPC_VERSION
+            and "method" in message)
+
 class MCPServer:
-    def __init__(self, name, version, capabilities=None):
+    def __init__(self, name, version, capabilities=None, concurrent=False, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 sessions=None, metrics=None, traced=False, profiler=None):
+        """
+        When 'concurrent' is true, each request with an "id" is dispatched as
+        its own task and responses are sent in completion order. At most
+        'max_concurrency' requests run at once per connection; further
+        requests wait in receive(), which in turn stops the reader.
+        
+        With a sessions.SessionStore in 'sessions', initialize issues a
+        session id (or resumes the one the client sends back) and handlers
+        can keep per-session state in self.session.state.
+        
+        'metrics' is a process-wide metrics.MCPMetrics recording requests,
+        latency and errors per method; the transport records the rest.
+        
+        When 'traced' is true, every request gets an OpenTelemetry server
+        span continuing the trace context found in its "_meta", with child
+        spans for decoding, queue wait, the handler and sending the reply.
+
+        With a profiling.RequestProfiler, handlers run under its sampling
+        and slow-request log; if the profiler allows it,
+        ADMIN_PROFILING_METHOD controls it.
+        """
         self.name = name
         self.version = version
         self.capabilities = capabilities or {}
@@ -40,9 +154,24 @@ class MCPServer:
         self.notification_handlers = {} # method -> async callable
         self.send = None                # Set once the transport is connected
         self.shutdown_event = asyncio.Event()
+        self.concurrent = concurrent
+        self.concurrency_limit = asyncio.Semaphore(max_concurrency)
+        self.inflight = {}              # request id -> asyncio.Task
+        self.batches = set()            # tasks answering concurrent batches
+        self.sessions = sessions
+        self.session = None             # sessions.Session once initialized
+        self.metrics = metrics
+        if traced:
+            tracing.check_available()
+        self.traced = traced
+        self.profiler = profiler
+        if profiler is not None and profiler.allow_admin:
+            self.register_request_handler(ADMIN_PROFILING_METHOD, profiler.admin)
 
     def register_request_handler(self, method, handler):
         self.request_handlers[method] = handler
+        if self.metrics is not None:
+            self.metrics.method(method)  # Create its label values now
 
     def register_notification_handler(self, method, handler):
         self.notification_handlers[method] = handler
@@ -51,121 +180,433 @@ class MCPServer:
         if self.send:
             await self.send(message)
 
+    async def send_progress(self, progress_token, progress, **fields):
+        """
+        Send a progress notification for the request streaming under 'progress_token'.
+        """
+        params = {"progressToken": progress_token, "progress": progress, **fields}
+        await self.send_message(create_notification(PROGRESS_NOTIFICATION, params))
+
     async def receive(self, message):
         """
-        Process an incoming JSON-RPC message.
+        Process an incoming JSON-RPC message or batch.
         
         Recognizes built-in methods:
          • "initialize": Returns server identity and capabilities.
          • "shutdown": Returns a response and triggers shutdown.
+         • "notifications/cancelled": Cancels the in-flight request named by
+           "requestId"; no response is sent for it (concurrent mode only).
+           Sent with an "id", it is answered with INVALID_REQUEST.
         
         For other requests, it dispatches to a registered handler.
         For notifications (without "id") it calls any registered handler.
+        A batch (a list of messages) is answered with one list of responses.
         """
-        if not isinstance(message, dict):
+        if isinstance(message, list):
+            await self.receive_batch(message)
             return
-        if message.get("jsonrpc") != JSON_RPC_VERSION:
+        if not is_valid_message(message):
             # Optionally reply with an error for unsupported JSON-RPC version.
+            # Responses (with "result" or "error") are not expected on the server side.
             return
 
-        # If "method" is present, it's a request or notification.
-        if "method" in message:
+        method = message["method"]
+        req_id = message.get("id")
+        if not is_valid_id(req_id):
+            # The id would key the in-flight table; reject it and keep serving.
+            self.count_error(INVALID_REQUEST)
+            await self.send_message(create_error_response(None, INVALID_REQUEST, "Invalid request id"))
+            return
+        params = message.get("params", {})
+        timing = message.pop(tracing.TIMING_KEY, None) if self.timed else None
+
+        # User-defined requests may run as their own task.
+        if req_id is not None and method not in BUILTIN_METHODS:
+            if self.concurrent:
+                await self.dispatch(req_id, self.handle_request, method, req_id, params, timing)
+            else:
+                await self.handle_request(method, req_id, params, timing)
+            return
+
+        response = await self.process(method, req_id, params)
+        if response is not None:
+            await self.send_message(response)
+        # Built-in shutdown: signal termination once the reply is sent.
+        if method == "shutdown":
+            self.shutdown_event.set()
+
+    async def receive_batch(self, batch):
+        """
+        Process a JSON-RPC batch.
+        
+        All members run concurrently; in concurrent mode each request takes
+        its own concurrency slot and the batch is answered from a separate
+        task, so receive() returns once the members are started. The
+        responses are sent as a single list, or not at all if the batch
+        held only notifications.
+        """
+        if not batch:
+            self.count_error(INVALID_REQUEST)
+            await self.send_message(create_error_response(None, INVALID_REQUEST, "Empty batch"))
+            return
+
+        errors = []
+        calls = []
+        shutdown = False
+        for message in batch:
+            if not is_valid_message(message):
+                self.count_error(INVALID_REQUEST)
+                errors.append(create_error_response(None, INVALID_REQUEST, "Invalid request"))
+                continue
+            if not is_valid_id(message.get("id")):
+                self.count_error(INVALID_REQUEST)
+                errors.append(create_error_response(None, INVALID_REQUEST, "Invalid request id"))
+                continue
             method = message["method"]
             req_id = message.get("id")
             params = message.get("params", {})
+            timing = message.pop(tracing.TIMING_KEY, None) if self.timed else None
+            shutdown = shutdown or method == "shutdown"
+            if self.concurrent and req_id is not None and method not in BUILTIN_METHODS:
+                call = self.traced_call if self.traced else self.call
+                calls.append(await self.dispatch(req_id, call, method, req_id, params, timing))
+            else:
+                calls.append(self.process(method, req_id, params))
 
-            # Built-in initialization
-            if method == "initialize":
-                result = {
-                    "serverName": self.name,
-                    "serverVersion": self.version,
-                    "capabilities": self.capabilities,
-                }
-                response = create_response(req_id, result)
-                await self.send_message(response)
-                return
-
-            # Built-in shutdown: reply and signal termination.
-            if method == "shutdown":
-                response = create_response(req_id, {"message": "Server shutting down"})
-                await self.send_message(response)
+        async def reply():
+            # Members cancelled by the client leave no response behind.
+            results = await asyncio.gather(*calls, return_exceptions=True)
+            responses = errors + [response for response in results if isinstance(response, dict)]
+            if responses:
+                await self.send_message(responses)
+            if shutdown:
                 self.shutdown_event.set()
-                return
 
-            # Process user-defined request handlers.
+        if self.concurrent:
+            task = asyncio.create_task(reply())
+            self.batches.add(task)
+            task.add_done_callback(self.batches.discard)
+            task.add_done_callback(report_task_error)
+        else:
+            await reply()
+
+    async def process(self, method, req_id, params):
+        """
+        Handle a request or notification inline and return the response to
+        send, if any. Shutdown is left to the caller, after the reply is sent.
+        """
+        # Built-in initialization
+        if method == "initialize":
+            result = {
+                "serverName": self.name,
+                "serverVersion": self.version,
+                "capabilities": self.capabilities,
+            }
+            if self.sessions is not None:
+                session_id = params.get("sessionId") if isinstance(params, dict) else None
+                result["sessionId"], result["sessionResumed"] = self.attach_session(session_id)
+            return create_response(req_id, result)
+
+        # Built-in shutdown
+        if method == "shutdown":
+            return create_response(req_id, {"message": "Server shutting down"})
+
+        # Built-in cancellation. It must be a notification; sent as a request
+        # it is answered with an error, since every request gets a response.
+        # Notifications never get an error reply, so malformed params are ignored.
+        if method == CANCELLED_NOTIFICATION:
             if req_id is not None:
-                handler = self.request_handlers.get(method)
-                if handler:
-                    try:
-                        result = await handler(params)
-                        response = create_response(req_id, result)
-                        await self.send_message(response)
-                    except Exception as e:
-                        error_response = create_error_response(req_id, INTERNAL_ERROR, str(e))
-                        await self.send_message(error_response)
-                else:
-                    error_response = create_error_response(req_id, METHOD_NOT_FOUND, f"Method '{method}' not found")
-                    await self.send_message(error_response)
+                self.count_error(INVALID_REQUEST)
+                return create_error_response(req_id, INVALID_REQUEST, f"'{method}' must be a notification")
+            if isinstance(params, dict) and is_valid_id(params.get("requestId")):
+                self.cancel_request(params.get("requestId"))
+            return None
+
+        # Process user-defined request handlers.
+        if req_id is not None:
+            return await self.call(method, req_id, params)
+
+        # This is a notification (no "id")
+        handler = self.notification_handlers.get(method)
+        if handler:
+            try:
+                await handler(params)
+            except Exception:
+                pass  # Optionally log error.
+        # No handler registered; ignore.
+        return None
+
+    @property
+    def timed(self):
+        # Whether the transport stamps messages with their receive times.
+        return self.traced or self.profiler is not None
+
+    async def call(self, method, req_id, params, timing=None):
+        """
+        Run the handler registered for 'method' and return its response.
+        'timing' holds the transport's receive times of the request, if any.
+        """
+        handler = self.request_handlers.get(method)
+        if handler:
+            started = time.perf_counter()
+            if self.profiler is not None and timing:
+                queue_wait = (tracing.now() - timing[1]) / 1e9
             else:
-                # This is a notification (no "id")
-                handler = self.notification_handlers.get(method)
-                if handler:
-                    try:
-                        await handler(params)
-                    except Exception:
-                        pass  # Optionally log error.
+                queue_wait = None
+            try:
+                if self.profiler is not None:
+                    result = await self.profiler.wrap(method, handler(params))
                 else:
-                    # No handler registered; ignore.
-                    pass
-        # Responses (with "result" or "error") are not expected on the server side.
+                    result = await handler(params)
+                response = create_response(req_id, result)
+            except Exception as e:
+                response = create_error_response(req_id, INTERNAL_ERROR, str(e))
+                self.count_error(INTERNAL_ERROR)
+            elapsed = time.perf_counter() - started
+            if self.metrics is not None:
+                method_metrics = self.metrics.method(method)
+                method_metrics.requests.inc()
+                method_metrics.latency.observe(elapsed)
+            if self.profiler is not None:
+                self.profiler.finished(method, params, elapsed, queue_wait)
+            return response
+        else:
+            self.count_error(METHOD_NOT_FOUND)
+            return create_error_response(req_id, METHOD_NOT_FOUND, f"Method '{method}' not found")
+
+    def count_error(self, code):
+        if self.metrics is not None:
+            self.metrics.error(code)
+
+    async def handle_request(self, method, req_id, params, timing=None):
+        """
+        Run the handler registered for 'method' and send its response.
+        """
+        if not self.traced:
+            response = await self.call(method, req_id, params, timing)
+            await self.send_message(response)
+            return
+        with tracing.request_span(method, req_id, params, timing) as span:
+            with tracing.span("handler"):
+                response = await self.call(method, req_id, params, timing)
+            tracing.record_response(span, response)
+            with tracing.span("send"):
+                await self.send_message(response)
+
+    async def traced_call(self, method, req_id, params, timing=None):
+        """
+        Like call(), inside a server span; used for concurrent batch members,
+        whose responses are sent together.
+        """
+        with tracing.request_span(method, req_id, params, timing) as span:
+            with tracing.span("handler"):
+                response = await self.call(method, req_id, params, timing)
+            tracing.record_response(span, response)
+            return response
+
+    async def dispatch(self, req_id, func, *args):
+        """
+        Start func(*args) as a task once a concurrency slot is free and
+        return the task.
+        """
+        await self.concurrency_limit.acquire()
+        task = asyncio.create_task(func(*args))
+        self.inflight[req_id] = task
+
+        def done(task):
+            self.concurrency_limit.release()
+            if self.inflight.get(req_id) is task:
+                del self.inflight[req_id]
+            report_task_error(task)
+        task.add_done_callback(done)
+        return task
+
+    def attach_session(self, session_id):
+        """
+        Attach this connection to a session, resuming 'session_id' if the
+        store still has it. Returns the session id and whether it was resumed.
+        """
+        self.close_session()
+        self.session, resumed = self.sessions.attach(session_id)
+        return self.session.session_id, resumed
+
+    def close_session(self):
+        """
+        Detach from the current session; it is kept for reconnects until
+        the store's TTL runs out.
+        """
+        if self.session is not None:
+            self.sessions.detach(self.session)
+            self.session = None
+
+    def cancel_request(self, req_id):
+        """
+        Cancel the in-flight request 'req_id', if any. The handler sees
+        asyncio.CancelledError and no response is sent.
+        """
+        task = self.inflight.get(req_id)
+        if task is not None:
+            task.cancel()
+
+    async def wait_inflight(self, timeout=None):
+        """
+        Wait up to 'timeout' seconds for the requests in flight to finish.
+        """
+        tasks = [*self.inflight.values(), *self.batches]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    async def cancel_inflight(self):
+        """
+        Cancel all requests still running, e.g. when the connection closes.
+        """
+        tasks = [*self.inflight.values(), *self.batches]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     async def wait_closed(self):
         await self.shutdown_event.wait()
 
 @asynccontextmanager
-async def websocket_transport_server(websocket):
+async def websocket_transport_server(websocket, max_queue=DEFAULT_QUEUE_SIZE, overflow=OVERFLOW_BLOCK, codec=None,
+                                     metrics=None, timed=False):
     """
     Wrap an accepted WebSocket connection in a transport context.
     
+    At most 'max_queue' received messages are buffered; 'overflow' selects
+    what happens when the buffer is full (see transport.MessageQueue).
+    Messages are encoded with the codec of the negotiated binary subprotocol,
+    if any; otherwise with the JSON 'codec', by default the fastest
+    installed JSON library (see codec.get_codec). With a metrics.MCPMetrics,
+    the connection, its queue, frames and bytes are recorded. When 'timed'
+    is true, decoded messages carry their receive and decode times for
+    MCPServer's spans and slow-request log.
+    
     Yields:
       send_func: Function to send JSON-RPC messages.
-      queue: An asyncio.Queue of received messages.
+      queue: A MessageQueue of received messages.
     """
+    codec = codec_for_subprotocol(websocket.subprotocol, codec)
     async with anyio.create_task_group() as tg:
-        queue = asyncio.Queue()
+        queue = MessageQueue(max_queue, overflow)
+        if metrics is not None:
+            metrics.connection_opened(queue)
+
+        async def reject(message):
+            if metrics is not None:
+                metrics.error(SERVER_BUSY)
+            await send_message(create_error_response(message["id"], SERVER_BUSY, "Server busy"))
 
         async def receive_loop():
             try:
                 while True:
-                    message_text = await websocket.recv()
+                    # Take the raw frame so text is decoded once, by the codec.
+                    data = await websocket.recv(decode=False)
+                    if timed:
+                        received = tracing.now()
+                    if metrics is not None:
+                        metrics.messages_in.inc()
+                        metrics.bytes_in.inc(len(data))
                     try:
-                        message = json.loads(message_text)
-                    except json.JSONDecodeError:
-                        # Optionally send a parse error response.
+                        message = codec.decode(data)
+                    except ValueError as e:
+                        # The request id is unknown, so the error carries id null.
+                        if metrics is not None:
+                            metrics.error(PARSE_ERROR)
+                        await send_message(create_error_response(None, PARSE_ERROR, "Parse error", str(e)))
                         continue
-                    await queue.put(message)
+                    if timed:
+                        tracing.stamp(message, received)
+                    await queue.offer(message, reject)
             except Exception:
                 pass  # Connection closed or error.
+            await queue.put(CONNECTION_CLOSED)
 
         tg.start_soon(receive_loop)
 
         async def send_message(message):
-            payload = json.dumps(message)
-            await websocket.send(payload)
+            # Byte payloads from JSON codecs are sent as text frames
+            # without a str round-trip.
+            try:
+                payload = codec.encode(message)
+            except EncodeError:
+                if metrics is not None:
+                    metrics.error(INTERNAL_ERROR)
+                payload = codec.encode(encodable_responses(codec, message))
+            if metrics is not None:
+                metrics.messages_out.inc()
+                metrics.bytes_out.inc(len(payload))
+            await websocket.send(payload, text=codec.text)
 
         try:
             yield send_message, queue
         finally:
-            tg.cancel_scope.cancel()
+            if metrics is not None:
+                metrics.connection_closed(queue)
+            # Close before cancelling: awaiting inside the cancelled scope
+            # would replace an exception raised by the caller.
             await websocket.close()
+            tg.cancel_scope.cancel()
 
-async def websocket_server_handler(websocket):
+async def serve_connection(server, websocket, drain=None, **transport_options):
+    """
+    Run 'server' over an accepted WebSocket connection.
+    'transport_options' are passed to websocket_transport_server.
+    
+    Messages are processed as they arrive until the client disconnects or
+    the server's shutdown event is set. The loop sleeps on the receive
+    queue alone; a single watcher task per connection interrupts it on
+    shutdown. Requests still in flight are cancelled on exit, except when
+    the process-wide 'drain' (a workers.Drain) fires: then reading stops
+    and the requests already started get drain.timeout seconds to finish.
+    """
+    async with websocket_transport_server(websocket, metrics=server.metrics, timed=server.timed,
+                                          **transport_options) as (send_func, message_queue):
+        server.send = send_func
+        try:
+            async with anyio.create_task_group() as tg:
+                async def stop_on(event):
+                    await event.wait()
+                    tg.cancel_scope.cancel()
+                tg.start_soon(stop_on, server.shutdown_event)
+                if drain is not None:
+                    tg.start_soon(stop_on, drain.event)
+
+                while True:
+                    message = await message_queue.get()
+                    if message is CONNECTION_CLOSED:
+                        break
+                    await server.receive(message)
+                tg.cancel_scope.cancel()
+            if drain is not None and drain.event.is_set():
+                await server.wait_inflight(drain.timeout)
+        finally:
+            await server.cancel_inflight()
+            server.close_session()
+
+async def websocket_server_handler(websocket, max_concurrency=DEFAULT_MAX_CONCURRENCY, drain=None, sessions=None,
+                                   metrics=None, traced=False, profiler=None, **transport_options):
     """
     Wraps an accepted WebSocket connection in an MCP server.
     The 'path' parameter has been removed as it's no longer used in newer websockets versions.
     """
-    server = MCPServer("example-server", "1.0.0", capabilities={"streaming": True})
-    
+    server = MCPServer("example-server", "1.0.0", capabilities={"streaming": True},
+                       concurrent=True, max_concurrency=max_concurrency, sessions=sessions, metrics=metrics,
+                       traced=traced, profiler=profiler)
+    register_example_handlers(server)
+
+    # Process incoming messages until a shutdown is requested.
+    await serve_connection(server, websocket, drain, **transport_options)
+
+def register_example_handlers(server):
+    """
+    Register the example server's methods on 'server':
+      • "list_resources": a fixed example resource.
+      • "stream_data": sends "chunks" (default 5) stream_data_chunk
+        notifications, "interval" seconds (default 1) apart.
+      • "echo": returns its params unchanged.
+    """
     # Handler for "list_resources" requests.
     async def list_resources_handler(params):
         return [{"uri": "example://resource", "name": "Example Resource"}]
@@ -174,14 +615,14 @@ async def websocket_server_handler(websocket):
     # Handler for "stream_data" requests: sends multiple notifications simulating streaming.
     async def stream_data_handler(params):
         stream_id = params.get("stream_id", "default")
-        for i in range(5):
+        for i in range(params.get("chunks", 5)):
             chunk_message = {
                 "jsonrpc": JSON_RPC_VERSION,
                 "method": "stream_data_chunk",
                 "params": {"stream_id": stream_id, "chunk": f"Data chunk {i+1}"}
             }
             await server.send_message(chunk_message)
-            await asyncio.sleep(1)
+            await asyncio.sleep(params.get("interval", 1))
         complete_message = {
             "jsonrpc": JSON_RPC_VERSION,
             "method": "stream_complete",
@@ -191,29 +632,145 @@ async def websocket_server_handler(websocket):
         return {"status": "streaming started"}
     server.register_request_handler("stream_data", stream_data_handler)
 
+    # Handler for "echo" requests, e.g. to measure round trips.
+    async def echo_handler(params):
+        return params
+    server.register_request_handler("echo", echo_handler)
+
     # Handler for "initialized" notifications from the client.
     async def initialized_notification_handler(params):
         print("Client completed initialization:", params)
     server.register_notification_handler("initialized", initialized_notification_handler)
 
-    async with websocket_transport_server(websocket) as (send_func, message_queue):
-        server.send = send_func
-        # Loop processing incoming messages until a shutdown is requested.
-        while not server.shutdown_event.is_set():
-            try:
-                message = await asyncio.wait_for(message_queue.get(), timeout=1)
-                await server.receive(message)
-            except asyncio.TimeoutError:
-                continue
-
-async def start_mcp_server():
-    async with websockets.serve(websocket_server_handler, "", 8765):  # Bind to all interfaces
+async def start_mcp_server(max_concurrency=DEFAULT_MAX_CONCURRENCY, subprotocols=None, compression=None,
+                           reuse_port=False, drain_timeout=DEFAULT_DRAIN_TIMEOUT, session_ttl=DEFAULT_SESSION_TTL,
+                           metrics_port=None, trace=None, profiling=None, block_threshold=None, worker=0,
+                           **transport_options):
+    drain = Drain(drain_timeout)
+    sessions = SessionStore(session_ttl)
+    metrics = await start_metrics(metrics_port, worker)
+    watchdog = start_watchdog(block_threshold, metrics)
+    traced = start_tracing(trace)
+    # 'profiling' holds RequestProfiler options from profiling.profiling_from_args().
+    profiler = RequestProfiler(**profiling) if profiling else None
+    handler = functools.partial(websocket_server_handler, max_concurrency=max_concurrency, drain=drain,
+                                sessions=sessions, metrics=metrics, traced=traced, profiler=profiler,
+                                **transport_options)
+    # Offer the given subprotocols in order of preference, binary ones first by default.
+    subprotocols = subprotocols or available_subprotocols()
+    # 'compression' holds permessage-deflate options from compression.server_compression().
+    # 'reuse_port' lets several worker processes bind the same port.
+    async with websockets.serve(handler, "", 8765,  # Bind to all interfaces
+                                subprotocols=subprotocols, select_subprotocol=select_subprotocol,
+                                reuse_port=reuse_port, **(compression or {})) as ws_server:
         print("MCP WebSocket Server running on ws://0.0.0.0:8765")
-        # Wait indefinitely until shutdown.
-        await asyncio.Future()
+        # Serve until SIGTERM/SIGINT, then drain.
+        try:
+            await run_until_stopped(ws_server, drain)
+        finally:
+            stop_profiler(profiler)
+            if watchdog is not None:
+                await watchdog.stop()
+
+async def start_metrics(metrics_port, worker=0):
+    """
+    Return a metrics.MCPMetrics served on 'metrics_port', or None if no
+    port is given. Worker N of a multi-process server (see workers.py)
+    listens on metrics_port + N so each worker can be scraped.
+    """
+    if metrics_port is None:
+        return None
+    metrics = MCPMetrics(ERROR_CODES)
+    await serve_metrics(metrics.registry, metrics_port + worker)
+    print(f"Metrics available on http://0.0.0.0:{metrics_port + worker}/metrics")
+    return metrics
+
+def start_watchdog(block_threshold, metrics):
+    """
+    Start a watchdog.LoopWatchdog on the running loop if its lag can be
+    exported ('metrics') or blocking calls should be reported
+    ('block_threshold' seconds), and return it; otherwise return None.
+    """
+    if block_threshold is None and metrics is None:
+        return None
+    watchdog = LoopWatchdog(block_threshold, metrics=metrics)
+    watchdog.start()
+    return watchdog
+
+def stop_profiler(profiler):
+    """
+    Write the collapsed stacks a profiler collected before the server exits.
+    """
+    if profiler is not None and profiler.sampled:
+        for path in profiler.write():
+            print(f"Wrote profile {path}")
+
+def add_trace_argument(parser):
+    parser.add_argument('--trace', choices=tracing.TRACE_MODES, default=None,
+                        help='Trace requests with OpenTelemetry: print spans to stdout ("console"), or export them '
+                             'through the SDK configured by the environment, e.g. opentelemetry-instrument '
+                             '("external")')
+
+def start_tracing(trace):
+    """
+    Set up request tracing for 'trace' (one of tracing.TRACE_MODES, or None
+    to leave it off) and return whether requests are traced.
+    """
+    if trace is None:
+        return False
+    if trace == tracing.TRACE_CONSOLE:
+        tracing.configure("console")
+    else:
+        tracing.check_available()
+    return True
 
 def main():
-    asyncio.run(start_mcp_server())
+    parser = argparse.ArgumentParser(description="Run the MCP server.")
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help='Maximum number of requests handled concurrently per connection')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Maximum number of received messages buffered per connection')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=OVERFLOW_BLOCK,
+                        help='What to do with incoming messages when the buffer is full')
+    parser.add_argument('--codec', choices=CODEC_CHOICES, default='auto',
+                        help='JSON library used to encode and decode messages')
+    parser.add_argument('--subprotocols', type=parse_subprotocols, default=None,
+                        help='Comma-separated subprotocols to negotiate, most preferred first '
+                             '(default: all installed, binary first)')
+    add_compression_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes sharing the port via SO_REUSEPORT')
+    parser.add_argument('--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+                        help='Seconds in-flight requests may take to finish on shutdown')
+    parser.add_argument('--session-ttl', type=float, default=DEFAULT_SESSION_TTL,
+                        help='Seconds a session is kept after its connection drops, for resumption')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve Prometheus metrics on this port (worker N of --workers uses port + N)')
+    add_trace_argument(parser)
+    add_profiling_arguments(parser)
+    add_watchdog_argument(parser)
+    eventloop.add_loop_arguments(parser)
+    args = parser.parse_args()
+
+    options = dict(
+        max_concurrency=args.max_concurrency,
+        subprotocols=args.subprotocols,
+        compression=compression_from_args(args, server=True),
+        drain_timeout=args.drain_timeout,
+        session_ttl=args.session_ttl,
+        metrics_port=args.metrics_port,
+        trace=args.trace,
+        profiling=profiling_from_args(args),
+        block_threshold=args.block_threshold,
+        max_queue=args.max_queue,
+        overflow=args.overflow,
+        codec=get_codec(args.codec),
+    )
+    loop_factory = eventloop.loop_from_args(args)
+    if args.workers > 1:
+        run_workers(start_mcp_server, args.workers, loop_factory=loop_factory, **options)
+    else:
+        eventloop.run(start_mcp_server(**options), loop_factory)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,275 @@
+import asyncio
+import bisect
+
+# Upper bounds, in seconds, of the handler latency histogram buckets.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Label value used for error codes outside the JSON-RPC set the server sends.
+OTHER = "other"
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+class GaugeValue(CounterValue):
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", repr(bound)),), cumulative
+        cumulative += self.counts[-1]
+        yield f"{name}_bucket", labels + (("le", "+Inf"),), cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, cumulative
+
+class MetricFamily:
+    """
+    A named metric with one value per combination of label values.
+
+    labels(*values) returns that combination's value object, creating it
+    on first use; callers on hot paths keep the returned object instead
+    of looking it up per event.
+    """
+    def __init__(self, name, help, kind, labelnames=(), factory=CounterValue):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self.factory()
+        return child
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in self.children.items():
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+class CallbackGauge:
+    """
+    A gauge without labels whose value is computed when scraped.
+    """
+    def __init__(self, name, help, func, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        lines.append(f"{self.name} {self.func()}")
+
+class CallbackFamily:
+    """
+    A labelled metric whose values are computed when scraped: func()
+    returns {label values: value}. Label values seen before and missing
+    now are reported as 0, so their series do not vanish.
+    """
+    def __init__(self, name, help, labelnames, func, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self.kind = kind
+        self.seen = set()
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        values = self.func()
+        self.seen.update(values)
+        for label_values in self.seen:
+            labels = tuple(zip(self.labelnames, label_values))
+            lines.append(f"{self.name}{format_labels(labels)} {values.get(label_values, 0)}")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+def escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.add(MetricFamily(name, help, "counter", labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.add(MetricFamily(name, help, "gauge", labelnames, GaugeValue))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.add(MetricFamily(name, help, "histogram", labelnames, lambda: HistogramValue(buckets)))
+
+    def callback(self, name, help, func, kind="gauge"):
+        return self.add(CallbackGauge(name, help, func, kind))
+
+    def callback_family(self, name, help, labelnames, func, kind="gauge"):
+        return self.add(CallbackFamily(name, help, labelnames, func, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            metric.render(lines)
+        lines.append("")
+        return "\n".join(lines)
+
+class MethodMetrics:
+    def __init__(self, requests, latency):
+        self.requests = requests
+        self.latency = latency
+
+class MCPMetrics:
+    """
+    Process-wide instrumentation shared by every connection of a server
+    (or client: the transports only record connections, frames and bytes).
+
+    Label values are created up front (error codes) or once per method
+    when its handler is registered, so recording an event is an attribute
+    access and an addition. Receive queue figures are read from the live
+    queues when scraped.
+    """
+    def __init__(self, error_codes=(), registry=None):
+        self.registry = registry or MetricsRegistry()
+        registry = self.registry
+        self.request_counts = registry.counter("mcp_requests_total", "Requests handled, by method", ("method",))
+        self.latencies = registry.histogram("mcp_request_duration_seconds", "Handler latency, by method",
+                                            ("method",))
+        self.error_counts = registry.counter("mcp_errors_total", "Error responses sent, by JSON-RPC code", ("code",))
+        self.errors = {code: self.error_counts.labels(str(code)) for code in error_codes}
+        self.other_errors = self.error_counts.labels(OTHER)
+        self.methods = {}
+        self.connections = registry.gauge("mcp_connections", "Open WebSocket connections").labels()
+        self.bytes_in = registry.counter("mcp_received_bytes_total", "Payload bytes received").labels()
+        self.bytes_out = registry.counter("mcp_sent_bytes_total",
+                                          "Payload bytes sent (characters for str frames)").labels()
+        self.messages_in = registry.counter("mcp_received_frames_total", "WebSocket messages received").labels()
+        self.messages_out = registry.counter("mcp_sent_frames_total", "WebSocket messages sent").labels()
+        self.queues = set()
+        # Drop and reject counts of closed connections, so the totals never go down.
+        self.closed_dropped = 0
+        self.closed_rejected = 0
+        registry.callback("mcp_queue_depth", "Messages waiting in receive queues",
+                          lambda: sum(queue.qsize() for queue in self.queues))
+        registry.callback("mcp_queue_max_depth", "Highest receive queue depth of any open connection",
+                          lambda: max((queue.max_depth for queue in self.queues), default=0))
+        registry.callback("mcp_queue_dropped_total", "Notifications dropped by full receive queues",
+                          lambda: self.closed_dropped + sum(queue.dropped for queue in self.queues), "counter")
+        registry.callback("mcp_queue_rejected_total", "Requests rejected by full receive queues",
+                          lambda: self.closed_rejected + sum(queue.rejected for queue in self.queues), "counter")
+
+    def method(self, name):
+        """
+        Return the metrics of method 'name', creating its label values.
+        """
+        metrics = self.methods.get(name)
+        if metrics is None:
+            metrics = self.methods[name] = MethodMetrics(self.request_counts.labels(name),
+                                                         self.latencies.labels(name))
+        return metrics
+
+    def error(self, code):
+        self.errors.get(code, self.other_errors).inc()
+
+    def track_scheduler(self, scheduler):
+        """
+        Export a scheduler.GenerationScheduler's running and waiting
+        generations per model, read when scraped, and record how long each
+        generation waited for its slot.
+        """
+        registry = self.registry
+        registry.callback_family("mcp_generations_running", "Generations running, by model", ("model",),
+                                 lambda: {(model,): count for model, count in scheduler.running_by_model.items()})
+        registry.callback_family("mcp_generations_waiting", "Generations queued for a slot, by model", ("model",),
+                                 lambda: {(model,): count for model, count in scheduler.waiting_by_model.items()})
+        scheduler.wait_time = registry.histogram("mcp_generation_wait_seconds",
+                                                 "Time generations waited for a slot").labels()
+
+    def track_cache(self, cache):
+        """
+        Export a response_cache.ResponseCache's hit, miss and eviction counts.
+        """
+        registry = self.registry
+        registry.callback("mcp_cache_hits_total", "Response cache hits served from memory",
+                          lambda: cache.hits, "counter")
+        registry.callback("mcp_cache_disk_hits_total", "Response cache hits read from the database",
+                          lambda: cache.disk_hits, "counter")
+        registry.callback("mcp_cache_misses_total", "Deterministic ask_llm calls not found in the response cache",
+                          lambda: cache.misses, "counter")
+        registry.callback("mcp_cache_evictions_total", "Answers evicted from the in-memory response cache",
+                          lambda: cache.evictions, "counter")
+
+    def connection_opened(self, queue):
+        self.connections.inc()
+        self.queues.add(queue)
+
+    def connection_closed(self, queue):
+        self.connections.dec()
+        self.queues.discard(queue)
+        self.closed_dropped += queue.dropped
+        self.closed_rejected += queue.rejected
+
+async def serve_metrics(registry, port, host=""):
+    """
+    Serve registry.render() at GET /metrics on 'port' and return the
+    asyncio server. The protocol handling is the bare minimum a
+    Prometheus scraper needs: one request per connection.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Skip the headers.
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
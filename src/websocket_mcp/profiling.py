@@ -0,0 +1,244 @@
+import collections
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+# Admin JSON-RPC method that reads and changes the profiler settings at runtime.
+ADMIN_PROFILING_METHOD = "admin/profiling"
+
+# Seconds between stack samples of a profiled request.
+DEFAULT_SAMPLE_INTERVAL = 0.001
+
+# Slow requests kept for the admin method, most recent last.
+SLOW_LOG_SIZE = 100
+
+def params_digest(params):
+    """
+    Short digest identifying a request's params without logging them.
+    """
+    try:
+        data = json.dumps(params, sort_keys=True, default=str).encode()
+    except (TypeError, ValueError):
+        data = repr(params).encode()
+    return hashlib.sha256(data).hexdigest()[:16]
+
+def frame_label(code):
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class ProfiledCoroutine:
+    """
+    Awaitable driving a coroutine step by step, and telling the sampler
+    which method is running during each step. Other tasks interleaving with
+    the coroutine are therefore never attributed to it.
+    """
+    def __init__(self, coro, method, sampler):
+        self.coro = coro
+        self.method = method
+        self.sampler = sampler
+
+    def __await__(self):
+        coro = self.coro
+        value = error = None
+        while True:
+            self.sampler.begin(self.method)
+            try:
+                if error is not None:
+                    yielded = coro.throw(error)
+                else:
+                    yielded = coro.send(value)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.sampler.end()
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+class StackSampler:
+    """
+    Sampling profiler for the event loop thread.
+
+    A background thread wakes every 'interval' seconds while a profiled
+    request is running a step, and counts the loop thread's stack under
+    that request's method. Stacks are cut at the request's coroutine, so
+    they only hold the handler's own frames.
+    """
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.thread_id = threading.get_ident()  # Created on the loop thread
+        self.stacks = collections.defaultdict(collections.Counter)  # method -> collapsed stack -> samples
+        self.lock = threading.Lock()  # Guards 'stacks' against the sampling thread
+        self.active = None
+        self.running = threading.Event()
+        self.thread = None
+
+    def begin(self, method):
+        self.active = method
+        self.running.set()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="mcp-stack-sampler", daemon=True)
+            self.thread.start()
+
+    def end(self):
+        self.active = None
+        self.running.clear()
+
+    def run(self):
+        while True:
+            self.running.wait()
+            time.sleep(self.interval)
+            method = self.active
+            frame = sys._current_frames().get(self.thread_id)
+            if method is None or frame is None or self.active != method:
+                continue
+            stack = []
+            while frame is not None and frame.f_code is not ProfiledCoroutine.__await__.__code__:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if frame is not None:  # Sampled inside the request, not between steps
+                with self.lock:
+                    self.stacks[method][";".join(reversed(stack))] += 1
+
+    def write(self, directory):
+        """
+        Write the samples of each method to '<directory>/<method>-<pid>.collapsed'
+        in the collapsed format read by flamegraph.pl and speedscope, and
+        return the paths.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            snapshot = {method: stacks.most_common() for method, stacks in self.stacks.items()}
+        paths = []
+        for method, stacks in snapshot.items():
+            name = method.replace("/", "_")
+            path = os.path.join(directory, f"{name}-{os.getpid()}.collapsed")
+            with open(path, "w") as f:
+                for stack, count in stacks:
+                    f.write(f"{method};{stack} {count}\n" if stack else f"{method} {count}\n")
+            paths.append(path)
+        return paths
+
+    def counts(self):
+        with self.lock:
+            return {method: sum(stacks.values()) for method, stacks in self.stacks.items()}
+
+    def reset(self):
+        with self.lock:
+            self.stacks.clear()
+
+class RequestProfiler:
+    """
+    Opt-in profiling of MCPServer request handlers, shared by every
+    connection of a process:
+      • a 'sample_rate' fraction of requests run under the stack sampler,
+        which accumulates collapsed stacks per method;
+      • requests whose handler takes longer than 'slow_threshold' seconds
+        are logged with a digest of their params, the time they waited in
+        the receive queue and the handler time.
+    With 'allow_admin', both settings can be changed at runtime through
+    ADMIN_PROFILING_METHOD. Any connected client can call it, and it writes
+    files to 'directory', so it is off by default.
+    """
+    def __init__(self, sample_rate=0.0, slow_threshold=None, directory="profiles",
+                 interval=DEFAULT_SAMPLE_INTERVAL, allow_admin=False):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.directory = directory
+        self.allow_admin = allow_admin
+        self.sampler = StackSampler(interval)
+        self.sampled = collections.Counter()  # method -> profiled requests
+        self.slow = collections.deque(maxlen=SLOW_LOG_SIZE)
+
+    def wrap(self, method, coro):
+        """
+        Return 'coro', or an awaitable profiling it if this request is sampled.
+        """
+        if self.sample_rate and random.random() < self.sample_rate:
+            self.sampled[method] += 1
+            return ProfiledCoroutine(coro, method, self.sampler)
+        return coro
+
+    def finished(self, method, params, handler_time, queue_wait=None):
+        if self.slow_threshold is None or handler_time < self.slow_threshold:
+            return
+        entry = {
+            "method": method,
+            "params_digest": params_digest(params),
+            "queue_wait": queue_wait,
+            "handler_time": handler_time,
+            "time": time.time(),
+        }
+        self.slow.append(entry)
+        queued = f"{queue_wait * 1000:.1f} ms" if queue_wait is not None else "unknown"
+        print(f"Slow request {method} params={entry['params_digest']}: queue wait {queued}, "
+              f"handler {handler_time * 1000:.1f} ms")
+
+    def status(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "slow_threshold": self.slow_threshold,
+            "directory": self.directory,
+            "sampled": dict(self.sampled),
+            "samples": self.sampler.counts(),
+            "slow": list(self.slow),
+        }
+
+    def write(self):
+        return self.sampler.write(self.directory)
+
+    async def admin(self, params):
+        """
+        ADMIN_PROFILING_METHOD handler. Optional params:
+          • "sample_rate": fraction of requests to profile, 0 to stop;
+          • "slow_threshold": seconds, or null to stop logging slow requests;
+          • "dump": write the collapsed stacks, returned under "written";
+          • "reset": forget the samples and slow requests collected so far.
+        Returns the resulting settings and counters.
+        """
+        if "sample_rate" in params:
+            sample_rate = params["sample_rate"]
+            if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be a number between 0 and 1")
+            self.sample_rate = sample_rate
+        if "slow_threshold" in params:
+            slow_threshold = params["slow_threshold"]
+            if slow_threshold is not None and (not isinstance(slow_threshold, (int, float)) or slow_threshold < 0):
+                raise ValueError("slow_threshold must be a non-negative number or null")
+            self.slow_threshold = slow_threshold
+        written = self.write() if params.get("dump") else None
+        if params.get("reset"):
+            self.sampler.reset()
+            self.sampled.clear()
+            self.slow.clear()
+        status = self.status()
+        if written is not None:
+            status["written"] = written
+        return status
+
+def add_profiling_arguments(parser):
+    parser.add_argument('--profiling', action='store_true',
+                        help='Enable request profiling')
+    parser.add_argument('--profiling-admin', action='store_true',
+                        help=f'Enable profiling and the {ADMIN_PROFILING_METHOD} method that changes its settings '
+                             'and writes profiles at runtime (any connected client can call it)')
+    parser.add_argument('--profile-rate', type=float, default=0.0,
+                        help='Fraction of requests to profile with the stack sampler')
+    parser.add_argument('--slow-threshold', type=float, default=None,
+                        help='Log requests whose handler takes longer than this many seconds')
+    parser.add_argument('--profile-dir', default="profiles",
+                        help='Directory the collapsed stacks are written to')
+
+def profiling_from_args(args):
+    """
+    Return RequestProfiler options from parsed arguments, or None if
+    profiling is off.
+    """
+    if not args.profiling and not args.profiling_admin:
+        return None
+    return {"sample_rate": args.profile_rate, "slow_threshold": args.slow_threshold, "directory": args.profile_dir,
+            "allow_admin": args.profiling_admin}
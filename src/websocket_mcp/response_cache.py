@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import sqlite3
+
+# Bytes of answers kept in memory by default when the cache is enabled.
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+def is_deterministic(options):
+    """
+    Return True if generation 'options' make ollama's output repeatable:
+    greedy decoding (temperature 0) or a fixed sampling seed.
+    """
+    return bool(options) and (options.get("temperature") == 0 or options.get("seed") is not None)
+
+def cache_key(digest, prompt, options):
+    """
+    Key an answer on the model's content digest rather than its name, so
+    re-pulling a model under the same tag never serves stale answers.
+    """
+    data = json.dumps([digest, prompt, options], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+class DiskCache:
+    """
+    SQLite tier of the response cache that survives restarts.
+
+    sqlite3 calls block, so they run on a single dedicated thread, which
+    also serializes access to the connection. Errors are logged and
+    treated as misses.
+    """
+    def __init__(self, path):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self.db = self.executor.submit(self.open, path).result()
+
+    @staticmethod
+    def open(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT NOT NULL)")
+        db.commit()
+        return db
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def load(self, key):
+        row = self.db.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def store(self, key, answer):
+        self.db.execute("INSERT OR REPLACE INTO answers (key, answer) VALUES (?, ?)", (key, answer))
+        self.db.commit()
+
+    async def get(self, key):
+        try:
+            return await self.run(self.load, key)
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+    async def put(self, key, answer):
+        # Worker processes may share the database; a write that loses
+        # the lock only costs a future cache miss.
+        try:
+            await self.run(self.store, key, answer)
+        except sqlite3.Error as e:
+            print(f"Error writing response cache: {e}")
+
+    def close(self):
+        self.executor.submit(self.db.close).result()
+        self.executor.shutdown()
+
+class ResponseCache:
+    """
+    Process-wide cache of complete ask_llm answers.
+
+    The memory tier is an LRU bounded by 'max_size' bytes of answer text;
+    with a 'path', answers are also written to an SQLite database and
+    memory misses fall back to it. Only deterministic generations (see
+    is_deterministic()) are cached. metrics() returns the hit/miss counts.
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, path=None):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()  # key -> answer, least recently used first
+        self.disk = DiskCache(path) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key):
+        answer = self.entries.get(key)
+        if answer is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return answer
+        if self.disk is not None:
+            answer = await self.disk.get(key)
+            if answer is not None:
+                self.disk_hits += 1
+                self.remember(key, answer)
+                return answer
+        self.misses += 1
+        return None
+
+    async def put(self, key, answer):
+        self.remember(key, answer)
+        if self.disk is not None:
+            await self.disk.put(key, answer)
+
+    def remember(self, key, answer):
+        size = len(answer.encode())
+        if size > self.max_size:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.encode())
+        self.entries[key] = answer
+        self.size += size
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.encode())
+            self.evictions += 1
+
+    def metrics(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,154 @@
+import asyncio
+import collections
+import contextlib
+import time
+
+# Priority classes, most urgent first. A queued request of a higher class
+# always starts before any request of a lower one.
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+class Waiter:
+    def __init__(self, model, owner):
+        self.model = model
+        self.owner = owner
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.queued = False
+        self.started = False
+
+class GenerationScheduler:
+    """
+    Admission control for generations in front of the model host.
+
+    At most 'slots' generations run at once, and at most 'per_model' of
+    them on the same model. Callers that cannot start wait in a queue:
+      • higher priority classes go first;
+      • within a class, queued (model, owner) pairs are served round-robin,
+        so a connection that floods the server only gets its turn like any
+        other, and a saturated model does not hold up requests for another.
+    The 'owner' of a request is any hashable identifying its connection.
+    """
+    def __init__(self, slots, per_model=None):
+        self.slots = slots
+        self.per_model = per_model or slots
+        self.running = 0
+        self.running_by_model = collections.Counter()
+        # One queue per priority class: (model, owner) -> deque of waiters,
+        # in round-robin order.
+        self.queues = [collections.OrderedDict() for _ in PRIORITIES]
+        self.waiting = 0
+        self.waiting_by_model = collections.Counter()
+        self.granted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_time = None  # Histogram set by metrics.MCPMetrics.track_scheduler()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model, priority=PRIORITY_NORMAL, owner=None):
+        """
+        Hold a generation slot for 'model' for the duration of the block.
+        """
+        await self.acquire(model, priority, owner)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def has_room(self, model):
+        return self.running < self.slots and self.running_by_model[model] < self.per_model
+
+    async def acquire(self, model, priority=PRIORITY_NORMAL, owner=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        waiter = Waiter(model, owner)
+        if self.waiting == 0 and self.has_room(model):
+            self.start(waiter)
+            return
+        queue = self.queues[PRIORITIES.index(priority)]
+        queue.setdefault((model, owner), collections.deque()).append(waiter)
+        waiter.queued = True
+        self.waiting += 1
+        self.waiting_by_model[model] += 1
+        # Other models may be saturated while this one has room.
+        self.dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.started:
+                # Granted just before the cancellation arrived.
+                self.release(model)
+            elif waiter.queued:
+                self.remove(queue, waiter)
+            raise
+
+    def remove(self, queue, waiter):
+        key = (waiter.model, waiter.owner)
+        waiters = queue[key]
+        waiters.remove(waiter)
+        if not waiters:
+            del queue[key]
+        self.dequeued(waiter)
+
+    def dequeued(self, waiter):
+        waiter.queued = False
+        self.waiting -= 1
+        self.waiting_by_model[waiter.model] -= 1
+        if not self.waiting_by_model[waiter.model]:
+            del self.waiting_by_model[waiter.model]
+
+    def start(self, waiter):
+        waiter.started = True
+        self.running += 1
+        self.running_by_model[waiter.model] += 1
+        wait = time.monotonic() - waiter.enqueued
+        self.granted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        if self.wait_time is not None:
+            self.wait_time.observe(wait)
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+
+    def release(self, model):
+        self.running -= 1
+        self.running_by_model[model] -= 1
+        if not self.running_by_model[model]:
+            del self.running_by_model[model]
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        Start queued waiters while there are free slots.
+        """
+        while self.waiting and self.running < self.slots:
+            waiter = self.next_waiter()
+            if waiter is None:
+                return
+            self.dequeued(waiter)
+            if not waiter.future.cancelled():  # Skip waiters whose task was cancelled
+                self.start(waiter)
+
+    def next_waiter(self):
+        for queue in self.queues:
+            for key, waiters in queue.items():
+                if self.has_room(key[0]):
+                    waiter = waiters.popleft()
+                    if waiters:
+                        queue.move_to_end(key)
+                    else:
+                        del queue[key]
+                    return waiter
+        return None
+
+    def metrics(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "waiting_by_model": dict(self.waiting_by_model),
+            "granted": self.granted,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+        }
@@ -0,0 +1,54 @@
+import secrets
+import time
+
+# Seconds a session outlives its connection, waiting for the client to reconnect.
+DEFAULT_SESSION_TTL = 300.0
+
+class Session:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.state = {}          # Per-session state kept by handlers
+        self.connections = 0     # Connections currently attached
+        self.detached_at = None  # When the last connection went away
+
+class SessionStore:
+    """
+    Process-wide per-session state that survives reconnects.
+
+    The server issues a session id in its initialize result. A client that
+    reconnects and sends that id back as "sessionId" in its next initialize
+    request reattaches to the same state instead of starting from scratch.
+    Sessions are dropped 'ttl' seconds after their last connection closes.
+    """
+    def __init__(self, ttl=DEFAULT_SESSION_TTL):
+        self.ttl = ttl
+        self.sessions = {}
+
+    def attach(self, session_id=None):
+        """
+        Return the session for 'session_id', or a new session if the id is
+        missing, unknown, expired or not a string, since it comes from the
+        client. The second value tells whether an existing session was
+        resumed.
+        """
+        self.expire()
+        session = self.sessions.get(session_id) if isinstance(session_id, str) else None
+        resumed = session is not None
+        if session is None:
+            session = Session(secrets.token_urlsafe(16))
+            self.sessions[session.session_id] = session
+        session.connections += 1
+        session.detached_at = None
+        return session, resumed
+
+    def detach(self, session):
+        session.connections -= 1
+        if session.connections <= 0:
+            session.detached_at = time.monotonic()
+
+    def expire(self):
+        now = time.monotonic()
+        expired = [session_id for session_id, session in self.sessions.items()
+                   if session.detached_at is not None and now - session.detached_at > self.ttl]
+        for session_id in expired:
+            del self.sessions[session_id]
@@ -0,0 +1,146 @@
+import contextlib
+import time
+
+# Optional OpenTelemetry support; tracing cannot be enabled without it.
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+# Key under which a transport with tracing enabled stores a decoded
+# message's (received, decoded) times, in epoch nanoseconds as spans use.
+TIMING_KEY = "_mcp_timing"
+
+TRACER_NAME = "websocket_mcp"
+
+# Values of the servers' --trace option: print spans, or leave exporting
+# to a tracer provider set up outside this package.
+TRACE_CONSOLE = "console"
+TRACE_EXTERNAL = "external"
+TRACE_MODES = (TRACE_CONSOLE, TRACE_EXTERNAL)
+
+def check_available():
+    """
+    Raise ValueError unless the OpenTelemetry API is installed.
+    """
+    if trace is None:
+        raise ValueError("Tracing requires the opentelemetry-api package")
+
+def get_tracer():
+    return trace.get_tracer(TRACER_NAME)
+
+def now():
+    return time.time_ns()
+
+def stamp(message, received):
+    """
+    Record on a decoded message (or each member of a batch) when its frame
+    arrived and when decoding finished.
+    """
+    timing = (received, now())
+    if isinstance(message, dict):
+        message[TIMING_KEY] = timing
+    elif isinstance(message, list):
+        for member in message:
+            if isinstance(member, dict):
+                member[TIMING_KEY] = timing
+
+def inject(params):
+    """
+    Return a copy of request 'params' whose "_meta" carries the current
+    trace context (W3C "traceparent" and "tracestate").
+    """
+    if not isinstance(params, dict):
+        return params
+    carrier = {}
+    propagate.inject(carrier)
+    if not carrier:
+        return params
+    params = dict(params)
+    params["_meta"] = {**params.get("_meta", {}), **carrier}
+    return params
+
+def extract(params):
+    """
+    Return the trace context a request carries in its "_meta", if any.
+    """
+    meta = params.get("_meta") if isinstance(params, dict) else None
+    return propagate.extract(meta if isinstance(meta, dict) else {})
+
+@contextlib.contextmanager
+def client_span(method):
+    with get_tracer().start_as_current_span(f"mcp.client {method}", kind=SpanKind.CLIENT,
+                                            attributes={"rpc.method": method}) as span:
+        yield span
+
+@contextlib.contextmanager
+def request_span(method, req_id, params, timing=None):
+    """
+    Open the server span of a request as the current span, continuing the
+    trace from its "_meta". With the transport's 'timing', the span starts
+    when the frame arrived and gets "decode" and "queue wait" children
+    covering the time before the handler ran.
+    """
+    tracer = get_tracer()
+    start_time = timing[0] if timing else None
+    attributes = {"rpc.system": "jsonrpc", "rpc.method": method, "rpc.jsonrpc.request_id": str(req_id)}
+    with tracer.start_as_current_span(f"mcp.server {method}", context=extract(params), kind=SpanKind.SERVER,
+                                      start_time=start_time, attributes=attributes) as span:
+        if timing:
+            received, decoded = timing
+            tracer.start_span("decode", start_time=received).end(end_time=decoded)
+            tracer.start_span("queue wait", start_time=decoded).end()
+        yield span
+
+def span(name, **attributes):
+    """
+    Return a context manager running its block in a child span of the
+    current one, or doing nothing when OpenTelemetry is not installed.
+    """
+    if trace is None:
+        return contextlib.nullcontext()
+    return get_tracer().start_as_current_span(name, attributes=attributes)
+
+@contextlib.contextmanager
+def detached_span(name, **attributes):
+    """
+    Like span(), but without making the span current: for async generators,
+    whose body runs in the context of whoever iterates them.
+    """
+    if trace is None:
+        yield None
+        return
+    span = get_tracer().start_span(name, attributes=attributes)
+    try:
+        yield span
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        span.end()
+
+def record_response(span, response):
+    error = response.get("error")
+    if error is not None:
+        span.set_attribute("rpc.jsonrpc.error_code", error.get("code"))
+        span.set_status(Status(StatusCode.ERROR, error.get("message")))
+
+def configure(exporter):
+    """
+    Install an SDK tracer provider exporting through 'exporter' ("console"
+    or "memory") and return the exporter. The in-memory exporter keeps
+    finished spans in the process (get_finished_spans()), e.g. for tests.
+    Otherwise spans go to whatever provider the application configured.
+    """
+    check_available()
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter, SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    span_exporter = {"console": ConsoleSpanExporter, "memory": InMemorySpanExporter}[exporter]()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+    return span_exporter
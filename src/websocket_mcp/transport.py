@@ -0,0 +1,96 @@
+import asyncio
+
+# Default number of decoded messages buffered per connection.
+DEFAULT_QUEUE_SIZE = 256
+
+# Overflow policies applied when a receive queue is full:
+#  • "block": stop reading the socket until there is room, so TCP
+#    backpressure reaches the sender.
+#  • "drop_oldest": discard the oldest queued notification to make room.
+#  • "reject": answer the incoming request with an error instead of queueing it.
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_REJECT = "reject"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_REJECT)
+
+# Queued by a transport's reader after the connection has closed, so the
+# consumer wakes up instead of waiting on an empty queue forever.
+CONNECTION_CLOSED = object()
+
+def select_subprotocol(connection, subprotocols):
+    """
+    Subprotocol selection for websockets.serve().
+
+    Picks the server's most preferred subprotocol among those the client
+    offered. Unlike the websockets default, a client that offers none (or
+    none in common) is accepted and speaks plain JSON.
+    """
+    offered = set(subprotocols)
+    for subprotocol in connection.protocol.available_subprotocols or ():
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+def is_notification(message):
+    return isinstance(message, dict) and "method" in message and "id" not in message
+
+def is_request(message):
+    return isinstance(message, dict) and "method" in message and "id" in message
+
+class MessageQueue(asyncio.Queue):
+    """
+    Bounded queue of received messages with an overflow policy.
+
+    Only notifications are ever dropped, and only requests are ever
+    rejected; anything else waits for room whatever the policy, so a
+    response is never lost. The current depth is qsize(); metrics()
+    returns it together with the high-water mark and drop/reject counts.
+    """
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, overflow=OVERFLOW_BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.max_depth = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    async def offer(self, message, reject=None):
+        """
+        Queue 'message', applying the overflow policy if the queue is full.
+
+        'reject' is an async callable invoked with a refused request; without
+        it, requests always wait for room.
+        """
+        if self.full():
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                if not self.drop_oldest_notification() and is_notification(message):
+                    self.dropped += 1
+                    return
+            elif self.overflow == OVERFLOW_REJECT:
+                if is_notification(message):
+                    self.dropped += 1
+                    return
+                if reject is not None and is_request(message):
+                    self.rejected += 1
+                    await reject(message)
+                    return
+        await self.put(message)
+        self.max_depth = max(self.max_depth, self.qsize())
+
+    def drop_oldest_notification(self):
+        for queued in self._queue:
+            if is_notification(queued):
+                self._queue.remove(queued)
+                self.task_done()
+                self.dropped += 1
+                return True
+        return False
+
+    def metrics(self):
+        return {
+            "depth": self.qsize(),
+            "max_depth": self.max_depth,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Seconds between the watchdog's lag probes.
+DEFAULT_LAG_INTERVAL = 0.05
+
+# Upper bounds, in seconds, of the loop lag histogram buckets.
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Blocking episodes kept for inspection, most recent last.
+BLOCKED_LOG_SIZE = 20
+
+def loop_stack(frame):
+    """
+    Format the stack of the loop thread from 'frame' outwards, cut at the
+    event loop's callback runner so only the blocking task's frames remain.
+    Loops without a Python-level runner (uvloop) keep the whole stack.
+    """
+    entries = []
+    while frame is not None and frame.f_code is not asyncio.events.Handle._run.__code__:
+        entries.append((frame, frame.f_lineno))
+        frame = frame.f_back
+    return "".join(traceback.StackSummary.extract(reversed(entries)).format())
+
+class LoopWatchdog:
+    """
+    Measures event loop lag and catches callbacks that block the loop.
+
+    A probe task sleeps 'interval' seconds at a time and records how late
+    it wakes up in the mcp_event_loop_lag_seconds histogram. A monitor
+    thread watches the probe's heartbeat: once the loop has not run it for
+    'threshold' seconds, the thread captures the loop thread's stack while
+    the blocking call is still on it, prints it with the name of the task
+    that was running and counts it in mcp_event_loop_blocked_total.
+    """
+    def __init__(self, threshold=None, interval=DEFAULT_LAG_INTERVAL, metrics=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = self.blocked_count = None
+        if metrics is not None:
+            registry = metrics.registry
+            self.lag = registry.histogram("mcp_event_loop_lag_seconds", "Delay of the event loop's lag probe",
+                                          buckets=LAG_BUCKETS).labels()
+            self.blocked_count = registry.counter("mcp_event_loop_blocked_total",
+                                                  "Times the event loop was blocked past the threshold").labels()
+        self.max_lag = 0.0
+        self.blocked = collections.deque(maxlen=BLOCKED_LOG_SIZE)
+        self.heartbeat = time.monotonic()
+        self.stopped = threading.Event()
+        self.loop = None
+        self.thread_id = None
+        self.probe = None
+        self.thread = None
+
+    def start(self):
+        """
+        Start the probe on the running loop, and the monitor thread if a
+        threshold is set.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.probe = asyncio.create_task(self.run_probe(), name="mcp-loop-watchdog")
+        if self.threshold is not None:
+            self.thread = threading.Thread(target=self.monitor, name="mcp-loop-watchdog", daemon=True)
+            self.thread.start()
+
+    async def stop(self):
+        self.stopped.set()
+        if self.probe is not None:
+            self.probe.cancel()
+            try:
+                await self.probe
+            except asyncio.CancelledError:
+                pass
+        if self.thread is not None:
+            self.thread.join()
+
+    async def run_probe(self):
+        loop = self.loop
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0.0)
+            self.heartbeat = time.monotonic()
+            self.max_lag = max(self.max_lag, lag)
+            if self.lag is not None:
+                self.lag.observe(lag)
+
+    def monitor(self):
+        reported = None  # Heartbeat of the episode already reported
+        while not self.stopped.wait(min(self.interval, self.threshold / 2)):
+            heartbeat = self.heartbeat
+            # The probe's own sleep accounts for 'interval' of the gap.
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            self.report(stalled, asyncio.current_task(self.loop), loop_stack(frame))
+
+    def report(self, stalled, task, stack):
+        entry = {
+            "stalled": stalled,
+            "task": task.get_name() if task is not None else None,
+            "stack": stack,
+            "time": time.time(),
+        }
+        self.blocked.append(entry)
+        if self.blocked_count is not None:
+            self.blocked_count.inc()
+        print(f"Event loop of process {os.getpid()} blocked for over {stalled * 1000:.0f} ms "
+              f"in task {entry['task']}:\n{stack}", end="", file=sys.stderr)
+
+    def status(self):
+        return {
+            "threshold": self.threshold,
+            "max_lag": self.max_lag,
+            "blocked": list(self.blocked),
+        }
+
+def add_watchdog_argument(parser):
+    parser.add_argument('--block-threshold', type=float, default=None,
+                        help='Print the stack of any callback that blocks the event loop for longer than this '
+                             'many seconds')
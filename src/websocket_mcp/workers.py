@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+# Seconds a draining connection may spend finishing its in-flight requests.
+DEFAULT_DRAIN_TIMEOUT = 30.0
+
+# A worker that exits within MIN_UPTIME seconds of starting is restarted
+# only after RESTART_DELAY seconds, so a crashing worker cannot spin.
+MIN_UPTIME = 5.0
+RESTART_DELAY = 1.0
+
+class Drain:
+    """
+    Process-wide graceful shutdown signal shared by all connections.
+
+    Once 'event' is set, connections stop reading new messages, give the
+    requests they already started up to 'timeout' seconds to finish and
+    then close (see mcp_server.serve_connection).
+    """
+    def __init__(self, timeout=DEFAULT_DRAIN_TIMEOUT):
+        self.event = asyncio.Event()
+        self.timeout = timeout
+
+async def run_until_stopped(ws_server, drain):
+    """
+    Serve until SIGTERM or SIGINT, then drain: stop accepting connections,
+    let every open connection finish its in-flight requests and wait for
+    all connection handlers to return.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+
+    print(f"Process {os.getpid()} draining {len(ws_server.connections)} connection(s)")
+    drain.event.set()
+    ws_server.close(close_connections=False)
+    await ws_server.wait_closed()
+
+def run_worker(start_server, worker, kwargs, loop_factory=None):
+    # Forked workers inherit the supervisor's Python signal handlers;
+    # restore the defaults before run_until_stopped installs its own.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    asyncio.run(start_server(reuse_port=True, worker=worker, **kwargs), loop_factory=loop_factory)
+
+def run_workers(start_server, workers, drain_timeout=DEFAULT_DRAIN_TIMEOUT, loop_factory=None, **kwargs):
+    """
+    Run start_server(reuse_port=True, worker=N, drain_timeout=..., **kwargs)
+    in 'workers' forked processes, N counting from 0. Each one binds the
+    same port with SO_REUSEPORT and the kernel spreads new connections
+    across them. A restarted worker keeps its N. Workers run on loops
+    from 'loop_factory' (see eventloop.loop_factory()), if given.
+
+    The calling process supervises: workers that exit are restarted, and
+    on SIGTERM or SIGINT every worker is sent SIGTERM, drains and is
+    killed only if it is still running well after 'drain_timeout'.
+    """
+    context = multiprocessing.get_context("fork")
+    kwargs = {**kwargs, "drain_timeout": drain_timeout}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    def spawn(worker):
+        process = context.Process(target=run_worker, args=(start_server, worker, kwargs, loop_factory))
+        process.start()
+        return process, time.monotonic()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    processes = [spawn(worker) for worker in range(workers)]
+    print(f"Supervisor {os.getpid()} started {workers} workers")
+    while not stopping:
+        multiprocessing.connection.wait([process.sentinel for process, _ in processes], timeout=1.0)
+        for i, (process, started) in enumerate(processes):
+            if stopping or process.is_alive():
+                continue
+            print(f"Worker {process.pid} exited with code {process.exitcode}; restarting")
+            if time.monotonic() - started < MIN_UPTIME:
+                time.sleep(RESTART_DELAY)
+            processes[i] = spawn(i)
+
+    for process, _ in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + drain_timeout + 5.0
+    for process, _ in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            print(f"Worker {process.pid} did not drain in time; killing it")
+            process.kill()
+            process.join()